@@ -0,0 +1,84 @@
+u"""
+compares the former way of hashing and writing a document (deepcopy,
+recursive rewrite and json.dump of the full hashed list) with the way
+CorpusHash does it: the document is flattened, its tokens are mapped to their
+hashes, and the hashed document is rebuilt and serialized by a single dumps
+call of the configured serializer. tokens are looked up in a prebuilt encode
+dictionary, so only the document transformation and serialization are timed.
+
+usage: python benchmarks/hash_document.py [--documents N] [--repeat N]
+       [--serializer json|orjson|ujson]
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from corpushash.hashers import hash_token, _serialize_hashed_document
+from corpushash.formats import JSONFilesWriter, flatten_nested_list
+from corpushash.serializers import get_serializer
+
+
+def make_document(rnd, vocabulary, lines=200, sentences=4, words=12):
+    return [[[rnd.choice(vocabulary) for _ in range(words)]
+             for _ in range(sentences)] for _ in range(lines)]
+
+
+def legacy_hash_document(input_document, output_document, encode):
+    for ix, item in enumerate(input_document):
+        if isinstance(item, str):
+            output_document[ix] = encode(item)
+        else:
+            output_document[ix] = legacy_hash_document(item, output_document[ix],
+                                                       encode)
+    return output_document
+
+
+def legacy_export(document, file_path, encode):
+    output_document = copy.deepcopy(document)
+    encoded_document = legacy_hash_document(document, output_document, encode)
+    with open(file_path, mode='wt', encoding='utf-8') as output:
+        json.dump(encoded_document, output, ensure_ascii=False)
+
+
+def flat_export(document, file_path, encode, serializer):
+    tokens, shape = flatten_nested_list(document)
+    hashed_tokens = list(map(encode, tokens))
+    JSONFilesWriter(os.path.dirname(file_path)).write(
+        0, _serialize_hashed_document(hashed_tokens, shape, serializer))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--serializer', default='auto')
+    args = parser.parse_args()
+    serializer = get_serializer(args.serializer)
+    rnd = random.Random(0)
+    vocabulary = ['token{}'.format(i) for i in range(20000)]
+    encode_dictionary = {token: hash_token(token)[0] for token in vocabulary}
+    encode = encode_dictionary.__getitem__
+    documents = [make_document(rnd, vocabulary) for _ in range(args.documents)]
+    tokens = sum(len(s) for d in documents for l in d for s in l)
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, '0.json')
+        for name, export in (
+                ('deepcopy + recursive', legacy_export),
+                ('flat + ' + serializer.name,
+                 lambda d, f, e: flat_export(d, f, e, serializer))):
+            seconds = min(timeit.repeat(
+                lambda: [export(d, file_path, encode) for d in documents],
+                number=1, repeat=args.repeat))
+            print('{:<22} {:8.3f} s  {:12,.0f} tokens/s'.format(
+                name, seconds, tokens / seconds))
+
+
+if __name__ == '__main__':
+    main()
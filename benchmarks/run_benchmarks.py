@@ -0,0 +1,292 @@
+u"""
+benchmark suite for corpushash: times token hashing, corpus hashing, the
+dictionary and document I/O, and the nested list utilities on synthetic
+corpora, and reports throughput and peak memory as JSON.
+
+the corpora are generated offline, with a configurable number of documents,
+nesting depth and vocabulary, whose tokens are drawn from a Zipf-like
+distribution (see --skew), so that they look like natural language.
+
+usage: python benchmarks/run_benchmarks.py [--documents N] [--depth N] ...
+       [--output results.json] [--only hash_token,text_split]
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import corpushash
+from corpushash.hashers import (CorpusHash, hash_token, hash_tokens,
+                                walk_nested_list, text_split)
+from corpushash.tokenizers import iter_text_documents
+from corpushash.formats import flatten_nested_list, unflatten_nested_list
+
+
+def make_vocabulary(size, rnd):
+    """
+    :return: list: size distinct random tokens, of 2 to 12 letters
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyzáéíóúãõç'
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add(''.join(rnd.choice(letters)
+                               for _ in range(rnd.randint(2, 12))))
+    return sorted(vocabulary)
+
+
+class TokenSampler:
+    """
+    draws tokens from a vocabulary with probability proportional to
+    1 / rank ** skew (0 is uniform, 1 is Zipf's law).
+    """
+    def __init__(self, vocabulary, skew, rnd):
+        self.vocabulary = vocabulary
+        self.rnd = rnd
+        self.cumulative_weights = list(itertools.accumulate(
+            1 / rank ** skew for rank in range(1, len(vocabulary) + 1)))
+
+    def sample(self, count):
+        total = self.cumulative_weights[-1]
+        return [self.vocabulary[bisect.bisect(self.cumulative_weights,
+                                              self.rnd.random() * total)]
+                for _ in range(count)]
+
+
+def make_document(sampler, depth, branching, tokens_per_list):
+    """
+    :return: list: nested list of the given depth (depth 1 being a flat list
+    of tokens), each inner list holding branching sublists
+    """
+    if depth <= 1:
+        return sampler.sample(tokens_per_list)
+    return [make_document(sampler, depth - 1, branching, tokens_per_list)
+            for _ in range(branching)]
+
+
+def make_text(corpus):
+    """
+    :return: str: text whose text_split is similar to the corpus (lines of
+    sentences of words)
+    """
+    lines = []
+    for document in corpus:
+        tokens = list(walk_nested_list(document))
+        for start in range(0, len(tokens), 30):
+            line_tokens = tokens[start:start + 30]
+            lines.append('. '.join(' '.join(line_tokens[i:i + 10])
+                                   for i in range(0, len(line_tokens), 10)))
+    return '\n'.join(lines)
+
+
+def folder_size(path):
+    """
+    :return: int: size in bytes of the files in path (recursively)
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, file_name))
+               for root, _, file_names in os.walk(path)
+               for file_name in file_names)
+
+
+def measure(function, repeat):
+    """
+    runs function repeat times, then once more while tracing memory.
+    :return: dict: best time in seconds and peak traced memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'peak_memory_bytes': peak}
+
+
+def throughput(result, tokens=None, nbytes=None):
+    """
+    adds tokens/s and MB/s to a result, when relevant.
+    """
+    if tokens is not None:
+        result['tokens'] = tokens
+        result['tokens_per_second'] = tokens / result['seconds']
+    if nbytes is not None:
+        result['bytes'] = nbytes
+        result['megabytes_per_second'] = nbytes / result['seconds'] / 1e6
+    return result
+
+
+def run(args):
+    rnd = random.Random(args.seed)
+    sampler = TokenSampler(make_vocabulary(args.vocabulary, rnd), args.skew, rnd)
+    corpus = [make_document(sampler, args.depth, args.branching,
+                            args.tokens_per_list)
+              for _ in range(args.documents)]
+    corpus_tokens = sum(1 for document in corpus
+                        for _ in walk_nested_list(document))
+    distinct_tokens = list(dict.fromkeys(walk_nested_list(corpus)))
+    text = make_text(corpus)
+    work_path = tempfile.mkdtemp(prefix='corpushash-benchmarks-')
+    corpus_options = {'workers': args.workers,
+                      'dictionary_backend': args.backend,
+                      'output_format': args.output_format,
+                      'write_threads': args.write_threads}
+    counter = itertools.count()
+
+    def hash_corpus():
+        return CorpusHash(corpus, os.path.join(work_path, 'corpus{}'.format(
+                                                    next(counter))),
+                          **corpus_options)
+
+    results = {}
+    try:
+        benchmarks = {}
+        benchmarks['hash_token'] = lambda: throughput(measure(
+            lambda: [hash_token(token) for token in distinct_tokens],
+            args.repeat), tokens=len(distinct_tokens))
+        benchmarks['hash_tokens'] = lambda: throughput(measure(
+            lambda: hash_tokens(distinct_tokens), args.repeat),
+            tokens=len(distinct_tokens))
+
+        def bench_hash_corpus():
+            result = measure(hash_corpus, args.repeat)
+            return throughput(result, tokens=corpus_tokens,
+                              nbytes=folder_size(hash_corpus().public_path))
+        benchmarks['CorpusHash.hash_corpus'] = bench_hash_corpus
+
+        def bench_io():
+            hashed_corpus = hash_corpus()
+            private_path = os.path.join(hashed_corpus.corpus_path, 'private')
+            dictionaries_size = folder_size(private_path)
+            export_path = os.path.join(work_path, 'exported.json')
+            encode_dictionary = dict(hashed_corpus.encode_dictionary)
+            io_results = {}
+
+            def load_dictionaries():
+                hashed_corpus.dictionary_store.close()
+                hashed_corpus._load_dictionaries()
+            io_results['CorpusHash._load_dictionaries'] = throughput(measure(
+                load_dictionaries, args.repeat),
+                tokens=len(encode_dictionary), nbytes=dictionaries_size)
+            export = measure(lambda: hashed_corpus._export_work(
+                encode_dictionary, export_path), args.repeat)
+            io_results['CorpusHash._export_work'] = throughput(
+                export, tokens=len(encode_dictionary),
+                nbytes=os.path.getsize(export_path))
+            io_results['CorpusHash.read_hashed_corpus'] = throughput(measure(
+                lambda: list(hashed_corpus.read_hashed_corpus()), args.repeat),
+                tokens=corpus_tokens,
+                nbytes=folder_size(hashed_corpus.public_path))
+            return io_results
+        benchmarks['io'] = bench_io
+        benchmarks['walk_nested_list'] = lambda: throughput(measure(
+            lambda: [sum(1 for _ in walk_nested_list(document))
+                     for document in corpus], args.repeat),
+            tokens=corpus_tokens)
+        benchmarks['flatten_nested_list'] = lambda: throughput(measure(
+            lambda: [flatten_nested_list(document) for document in corpus],
+            args.repeat), tokens=corpus_tokens)
+        flat_corpus = [flatten_nested_list(document) for document in corpus]
+        benchmarks['unflatten_nested_list'] = lambda: throughput(measure(
+            lambda: [unflatten_nested_list(tokens, shape)
+                     for tokens, shape in flat_corpus], args.repeat),
+            tokens=corpus_tokens)
+        benchmarks['text_split'] = lambda: throughput(measure(
+            lambda: text_split(text), args.repeat),
+            tokens=corpus_tokens, nbytes=len(text.encode()))
+
+        def bench_iter_text_documents():
+            text_path = os.path.join(work_path, 'corpus.txt')
+            with open(text_path, 'w', encoding='utf-8') as text_file:
+                text_file.write(text)
+            return throughput(measure(lambda: sum(
+                1 for _ in iter_text_documents([text_path], workers=args.workers,
+                                               lines_per_document=100)),
+                args.repeat), tokens=corpus_tokens,
+                nbytes=os.path.getsize(text_path))
+        benchmarks['iter_text_documents'] = bench_iter_text_documents
+        for name, benchmark in benchmarks.items():
+            io_names = ('CorpusHash._load_dictionaries',
+                        'CorpusHash._export_work',
+                        'CorpusHash.read_hashed_corpus')
+            names = io_names if name == 'io' else (name,)
+            if args.only and not set(names) & set(args.only):
+                continue
+            result = benchmark()
+            if name == 'io':
+                results.update((io_name, io_result) for io_name, io_result
+                               in result.items()
+                               if not args.only or io_name in args.only)
+            else:
+                results[name] = result
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ('output', 'only')}
+    parameters.update(corpus_tokens=corpus_tokens,
+                      distinct_tokens=len(distinct_tokens))
+    return {'parameters': parameters,
+            'environment': {'python': platform.python_version(),
+                            'platform': platform.platform(),
+                            'corpushash': getattr(corpushash, '__version__',
+                                                  None)},
+            'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--documents', type=int, default=200,
+                        help='number of documents in the corpus')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='nesting depth of the documents')
+    parser.add_argument('--branching', type=int, default=10,
+                        help='number of sublists in each list')
+    parser.add_argument('--tokens-per-list', type=int, default=10,
+                        help='number of tokens in the innermost lists')
+    parser.add_argument('--vocabulary', type=int, default=20000,
+                        help='number of distinct tokens')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='Zipf exponent of the token distribution')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs of each benchmark (the best is kept)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='workers argument of CorpusHash')
+    parser.add_argument('--write-threads', type=int, default=None,
+                        help='write_threads argument of CorpusHash')
+    parser.add_argument('--backend', default='json',
+                        help='dictionary_backend argument of CorpusHash')
+    parser.add_argument('--output-format', default='json',
+                        help='output_format argument of CorpusHash')
+    parser.add_argument('--only', type=lambda names: names.split(','),
+                        help='comma-separated names of the benchmarks to run')
+    parser.add_argument('--output', help='file to write the results to '
+                        '(default: standard output)')
+    args = parser.parse_args()
+    logging.getLogger('corpushash.hashers').setLevel(logging.WARNING)
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
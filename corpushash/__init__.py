@@ -1,4 +1,12 @@
-from corpushash.hashers import CorpusHash, hash_token, walk_nested_list, text_split
+from corpushash.hashers import (CorpusHash, hash_token, hash_tokens, 
+                                 keyed_hash_token, keyed_hash_tokens, 
+                                 walk_nested_list, text_split, 
+                                 read_json_documents, read_jsonl_corpus, 
+                                 log_progress)
+from corpushash.formats import flatten_nested_list, unflatten_nested_list
+from corpushash.instrumentation import HashingStats
+from corpushash.tokenizers import iter_text_documents, tokenize_lines
+from corpushash.readers import HashedCorpus
 u"""
 Created on 24/02/17
 by fccoelho and odanoburu
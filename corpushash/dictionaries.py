@@ -0,0 +1,421 @@
+u"""
+storage backends for the encode and decode dictionaries kept in /private.
+
+a backend (store) is created with the path of the /private folder, and
+exposes the encode dictionary (token -> hashed token) and the decode
+dictionary (hashed token -> (token, salt)) as mappings, through its load
+method. flush persists the tokens added since the dictionaries were loaded.
+checkpoint persists the tokens added since the last checkpoint, so that they
+are not lost if the hashing is interrupted before flushing.
+
+the SQLite store keeps the encode dictionary behind a CachedDictionary, a
+least recently used cache of its entries bounded by a memory budget, so that
+memory use does not grow with the vocabulary.
+"""
+
+import os
+import re
+import sys
+import shutil
+import sqlite3
+import logging
+import itertools
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from corpushash.serializers import get_serializer
+
+
+logger = logging.getLogger(__name__)
+
+# memory budget of the cache of the encode dictionary of SQLite stores, in bytes
+DEFAULT_CACHE_MEMORY = 64 * 2 ** 20
+
+
+def write_atomically(file_path, data):
+    """
+    writes data to a temporary file, syncs it and renames it to file_path, so
+    that file_path holds either its previous content or data, even if the
+    writing is interrupted.
+    :param file_path: str: path of the file.
+    :param data: bytes: content of the file.
+    :return: None
+    """
+    temporary_path = file_path + '.tmp'
+    with open(temporary_path, mode='wb') as output:
+        output.write(data)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temporary_path, file_path)
+
+
+class JSONDictionaryStore:
+    """
+    keeps the dictionaries in memory as dicts, and stores them as two .json
+    files in /private. loading and flushing take time and memory proportional
+    to the size of the vocabulary. checkpoints only write the tokens added
+    since the previous one, to a new .json file in /private/dictionary_deltas,
+    which is merged into the dictionaries when they are loaded, and removed
+    when they are flushed.
+    """
+    def __init__(self, private_path, encoding='utf-8', indent_json=None,
+                 serializer='auto', cache_memory=None):
+        """
+        :param private_path: str: path of the /private folder.
+        :param encoding: str: encoding of the .json files.
+        :param indent_json: int: indentation of the .json files, as in
+        json.dump.
+        :param serializer: str or JSONSerializer: JSON library reading and
+        writing the .json files (see corpushash.serializers.get_serializer).
+        :param cache_memory: unused, as the dictionaries are wholly in memory.
+        kept for a common interface.
+        """
+        self.private_path = private_path
+        self.encoding = encoding
+        self.indent_json = indent_json
+        self.serializer = get_serializer(serializer, encoding)
+        self.encode_dictionary_path = os.path.join(private_path,
+                                                   'encode_dictionary.json')
+        self.decode_dictionary_path = os.path.join(private_path,
+                                                   'decode_dictionary.json')
+        self.deltas_path = os.path.join(private_path, 'dictionary_deltas')
+        self.encode_dictionary, self.decode_dictionary = {}, {}
+        # number of entries of the dictionaries already stored
+        self._stored_sizes = (0, 0)
+
+    def exists(self):
+        """
+        :return: bool: True if dictionaries from a previous hashing are stored.
+        """
+        return ((os.path.isfile(self.encode_dictionary_path) and
+                 os.path.isfile(self.decode_dictionary_path)) or
+                bool(self._delta_paths()))
+
+    def _delta_paths(self):
+        """
+        :return: list: paths of the checkpointed deltas, in order
+        """
+        if not os.path.isdir(self.deltas_path):
+            return []
+        numbers = sorted(int(file_name[:-5]) for file_name
+                         in os.listdir(self.deltas_path)
+                         if re.match(r'\d+\.json$', file_name))
+        return [os.path.join(self.deltas_path, '{}.json'.format(number))
+                for number in numbers]
+
+    def load(self):
+        """
+        loads the dictionaries from a previous hashing, if there are any.
+        :return: dict, dict: encode_dictionary, decode_dictionary
+        """
+        if os.path.isfile(self.encode_dictionary_path):
+            with open(self.encode_dictionary_path, 'rb') as f:
+                self.encode_dictionary = self.serializer.loads(f.read())
+            with open(self.decode_dictionary_path, 'rb') as f:
+                self.decode_dictionary = self.serializer.loads(f.read())
+        for delta_path in self._delta_paths():
+            with open(delta_path, 'rb') as f:
+                delta = self.serializer.loads(f.read())
+            self.encode_dictionary.update(delta['encode_dictionary'])
+            self.decode_dictionary.update(delta['decode_dictionary'])
+        self._stored_sizes = (len(self.encode_dictionary),
+                              len(self.decode_dictionary))
+        return self.encode_dictionary, self.decode_dictionary
+
+    def checkpoint(self):
+        """
+        atomically writes the tokens added since the dictionaries were loaded
+        or last checkpointed to a new delta file.
+        :return: None
+        """
+        # dicts keep their insertion order, so new tokens come last
+        delta = {'encode_dictionary': dict(itertools.islice(
+                            self.encode_dictionary.items(), self._stored_sizes[0],
+                            None)),
+                 'decode_dictionary': dict(itertools.islice(
+                            self.decode_dictionary.items(), self._stored_sizes[1],
+                            None))}
+        if not delta['encode_dictionary'] and not delta['decode_dictionary']:
+            return
+        delta_paths = self._delta_paths()
+        number = int(os.path.basename(delta_paths[-1])[:-5]) + 1 if delta_paths else 0
+        os.makedirs(self.deltas_path, exist_ok=True)
+        write_atomically(os.path.join(self.deltas_path, '{}.json'.format(number)),
+                         self.serializer.dumps(delta))
+        self._stored_sizes = (len(self.encode_dictionary),
+                              len(self.decode_dictionary))
+
+    def flush(self):
+        """
+        writes the whole dictionaries to their .json files, and removes the
+        deltas they now include. each file is written atomically (see
+        write_atomically), so an interrupted flush leaves the previous version
+        in place.
+        :return: None
+        """
+        for dictionary, file_path in ((self.encode_dictionary,
+                                       self.encode_dictionary_path),
+                                      (self.decode_dictionary,
+                                       self.decode_dictionary_path)):
+            write_atomically(file_path,
+                             self.serializer.dumps(dictionary, self.indent_json))
+        shutil.rmtree(self.deltas_path, ignore_errors=True)
+        self._stored_sizes = (len(self.encode_dictionary),
+                              len(self.decode_dictionary))
+
+    def close(self):
+        """
+        nothing to release, the dictionaries stay usable in memory.
+        :return: None
+        """
+        pass
+
+
+class SQLiteDictionary(MutableMapping):
+    """
+    mapping backed by a table of an SQLite database, whose first column is the
+    (primary) key and whose other columns are the value. lookups and inserts
+    touch a single row, so the table is never loaded into memory.
+    """
+    def __init__(self, connection, table, key_column, value_columns):
+        """
+        :param connection: sqlite3.Connection: database holding the table.
+        :param table: str: name of the table, created if not existent.
+        :param key_column: str: name of the key column.
+        :param value_columns: list: names of the value columns. if there is only
+        one, values are its content, else they are tuples.
+        """
+        self.connection = connection
+        self.single_value = len(value_columns) == 1
+        columns = ', '.join(['{} TEXT PRIMARY KEY'.format(key_column)] +
+                            ['{} TEXT'.format(column) for column in value_columns])
+        connection.execute('CREATE TABLE IF NOT EXISTS {} ({}) WITHOUT ROWID'
+                           .format(table, columns))
+        self._select = 'SELECT {} FROM {} WHERE {} = ?'.format(
+                                ', '.join(value_columns), table, key_column)
+        self._insert = 'INSERT OR REPLACE INTO {} VALUES ({})'.format(
+                                table, ', '.join('?' * (len(value_columns) + 1)))
+        self._delete = 'DELETE FROM {} WHERE {} = ?'.format(table, key_column)
+        self._count = 'SELECT COUNT(*) FROM {}'.format(table)
+        self._keys = 'SELECT {} FROM {}'.format(key_column, table)
+        self._items = 'SELECT * FROM {}'.format(table)
+
+    def __getitem__(self, key):
+        row = self.connection.execute(self._select, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0] if self.single_value else row
+
+    def __contains__(self, key):
+        return self.connection.execute(self._select, (key,)).fetchone() is not None
+
+    def __setitem__(self, key, value):
+        if self.single_value:
+            value = (value,)
+        self.connection.execute(self._insert, (key,) + tuple(value))
+
+    def __delitem__(self, key):
+        if self.connection.execute(self._delete, (key,)).rowcount == 0:
+            raise KeyError(key)
+
+    def __len__(self):
+        return self.connection.execute(self._count).fetchone()[0]
+
+    def __iter__(self):
+        for row in self.connection.execute(self._keys):
+            yield row[0]
+
+    def iter_items(self):
+        """
+        iterates over (key, value) pairs with a single query.
+        :yield: tuple: key, value
+        """
+        for row in self.connection.execute(self._items):
+            yield row[0], (row[1] if self.single_value else row[1:])
+
+    def update_many(self, items):
+        """
+        inserts (key, value) pairs with a single executemany call.
+        :param items: iterable: (key, value) pairs.
+        :return: None
+        """
+        if not self.single_value:
+            items = ((key,) + tuple(value) for key, value in items)
+        self.connection.executemany(self._insert, items)
+
+
+class CachedDictionary(MutableMapping):
+    """
+    mapping that keeps the most recently used entries of another mapping
+    (e.g. a SQLiteDictionary) in memory, within a memory budget. lookups are
+    served from the cache when possible (hits), else from the mapping
+    (misses), and the entries found are cached, evicting the least recently
+    used ones when over budget. writes go through to the mapping. the memory
+    of an entry is estimated with sys.getsizeof.
+    """
+    # estimated memory of an entry of the cache besides its key and value
+    ENTRY_OVERHEAD = 100
+
+    def __init__(self, mapping, memory_budget=DEFAULT_CACHE_MEMORY):
+        """
+        :param mapping: MutableMapping: the mapping to be cached.
+        :param memory_budget: int: maximum memory of the cached entries, in
+        bytes.
+        """
+        self.mapping = mapping
+        self.memory_budget = memory_budget
+        self.memory = 0  # estimated memory of the cached entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+
+    def _entry_memory(self, key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + self.ENTRY_OVERHEAD
+
+    def _cache_entry(self, key, value):
+        if key in self._cache:
+            self.memory -= self._entry_memory(key, self._cache.pop(key))
+        self._cache[key] = value
+        self.memory += self._entry_memory(key, value)
+        while self.memory > self.memory_budget and self._cache:
+            old_key, old_value = self._cache.popitem(last=False)
+            self.memory -= self._entry_memory(old_key, old_value)
+            self.evictions += 1
+
+    def __getitem__(self, key):
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            value = self.mapping[key]
+            self._cache_entry(key, value)
+            return value
+        self.hits += 1
+        self._cache.move_to_end(key)
+        return value
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __setitem__(self, key, value):
+        self.mapping[key] = value
+        self._cache_entry(key, value)
+
+    def __delitem__(self, key):
+        if key in self._cache:
+            self.memory -= self._entry_memory(key, self._cache.pop(key))
+        del self.mapping[key]
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __iter__(self):
+        return iter(self.mapping)
+
+    def cache_info(self):
+        """
+        :return: dict: hits, misses, evictions, number of cached entries and
+        their estimated memory, and the memory budget
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._cache),
+                'memory': self.memory, 'memory_budget': self.memory_budget}
+
+
+class SQLiteDictionaryStore:
+    """
+    stores the dictionaries in an SQLite database in /private. tokens are
+    looked up and inserted one row at a time, and only the rows added are
+    written when flushing, so a run costs time proportional to the documents
+    hashed, not to the size of the vocabulary. dictionaries from a previous
+    hashing stored as .json are imported the first time.
+    """
+    def __init__(self, private_path, encoding='utf-8', indent_json=None,
+                 serializer='auto', cache_memory=DEFAULT_CACHE_MEMORY):
+        """
+        :param private_path: str: path of the /private folder.
+        :param encoding: str: encoding of the .json dictionaries to import.
+        :param indent_json: unused, kept for a common interface.
+        :param serializer: str or JSONSerializer: JSON library reading the
+        .json dictionaries to import.
+        :param cache_memory: int: memory budget, in bytes, of the cache of the
+        encode dictionary (see CachedDictionary). 0 disables the cache.
+        """
+        self.private_path = private_path
+        self.encoding = encoding
+        self.serializer = serializer
+        self.cache_memory = cache_memory
+        self.database_path = os.path.join(private_path, 'dictionaries.sqlite')
+        self.connection = None
+        self.encode_dictionary, self.decode_dictionary = None, None
+
+    def exists(self):
+        """
+        :return: bool: True if dictionaries from a previous hashing are stored.
+        """
+        return os.path.isfile(self.database_path)
+
+    def load(self):
+        """
+        opens (or creates) the database, importing the .json dictionaries from
+        a previous hashing if the database is new.
+        :return: SQLiteDictionary, SQLiteDictionary: encode_dictionary,
+        decode_dictionary
+        """
+        is_new = not self.exists()
+        self.connection = sqlite3.connect(self.database_path)
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        self.encode_dictionary = SQLiteDictionary(self.connection,
+                                                  'encode_dictionary', 'token',
+                                                  ['hashed_token'])
+        self.decode_dictionary = SQLiteDictionary(self.connection,
+                                                  'decode_dictionary',
+                                                  'hashed_token',
+                                                  ['token', 'salt'])
+        json_store = JSONDictionaryStore(self.private_path, self.encoding,
+                                         serializer=self.serializer)
+        if is_new and json_store.exists():
+            logger.info('importing .json dictionaries into {}.'.format(
+                                                        self.database_path))
+            encode_dictionary, decode_dictionary = json_store.load()
+            self.encode_dictionary.update_many(encode_dictionary.items())
+            self.decode_dictionary.update_many(decode_dictionary.items())
+        self.connection.commit()
+        if self.cache_memory:
+            self.encode_dictionary = CachedDictionary(self.encode_dictionary,
+                                                      self.cache_memory)
+        return self.encode_dictionary, self.decode_dictionary
+
+    def flush(self):
+        """
+        commits the tokens added since the last flush.
+        :return: None
+        """
+        self.connection.commit()
+
+    def checkpoint(self):
+        """
+        commits the tokens added since the last checkpoint, as flush does.
+        :return: None
+        """
+        self.connection.commit()
+
+    def close(self):
+        """
+        commits and closes the database. the dictionaries can't be used
+        afterwards.
+        :return: None
+        """
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+
+
+DICTIONARY_BACKENDS = {'json': JSONDictionaryStore,
+                       'sqlite': SQLiteDictionaryStore}
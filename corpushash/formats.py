@@ -0,0 +1,897 @@
+u"""
+output formats of the hashed documents stored in a /public folder.
+
+- 'json': one {ix}.json file per document, the original format.
+- 'jsonl': a packed format, with all documents of the folder in a single
+  JSON-lines file (corpus.jsonl, one document per line) and an index of the
+  offset where each document ends (corpus.index, little-endian uint64), which
+  makes documents randomly accessible.
+
+besides either of them, documents may be stored as integer ids in the ids/
+subfolder (see IdsWriter), for consumers that map hashed tokens to integers
+anyway. the nesting of the documents is then kept in the flat representation
+of flatten_nested_list.
+
+each format has a writer, to which documents are written in order as
+encoded JSON text or as fragments of JSON text (see iter_hashed_json), and a
+reader, which supports len(), iteration and indexing, and parses documents
+with a serializer (see corpushash.serializers).
+"""
+
+import os
+import re
+import sys
+import mmap
+import array
+import queue
+import bisect
+import itertools
+import threading
+
+from corpushash.serializers import get_serializer
+
+
+PACKED_CORPUS_FILE = 'corpus.jsonl'
+PACKED_INDEX_FILE = 'corpus.index'
+IDS_FOLDER = 'ids'
+IDS_VOCABULARY_FILE = 'vocabulary.txt'
+IDS_TOKENS_FILE = 'tokens.bin'
+IDS_SHAPES_FILE = 'shapes.bin'
+IDS_INDEX_FILE = 'index.bin'
+READ_BUFFER_SIZE = 1 << 20
+# index entries kept in memory before being written, after the data they index
+INDEX_BUFFER_SIZE = 1 << 13
+
+
+def iter_hashed_json(input_document, encode, indent_json=None):
+    """
+    serializes input_document as JSON while hashing its tokens, yielding the
+    output in fragments, so that the hashed document is never built in
+    memory. the output is the same as json.dump(hashed_document,
+    indent=indent_json) would write. hashed tokens are base85 strings, whose
+    alphabet has no characters that need escaping in JSON.
+    :param input_document: list: nested list of tokens (nested list of str).
+    :param encode: callable: takes a token and returns its hash.
+    :param indent_json: int or str or None: indentation, as in json.dump.
+    :yield: str: the next fragment of the JSON output
+    """
+    if indent_json is None:
+        item_separator, indent = ', ', None
+    else:
+        item_separator = ','
+        indent = ' ' * indent_json if isinstance(indent_json, int) else indent_json
+    stack = [iter(input_document)]
+    is_first = True
+    yield '['
+    while stack:
+        for item in stack[-1]:
+            prefix = '' if is_first else item_separator
+            if indent is not None:
+                prefix += '\n' + indent * len(stack)
+            if isinstance(item, str):
+                yield prefix + '"' + encode(item) + '"'
+                is_first = False
+            else:
+                yield prefix + '['
+                stack.append(iter(item))
+                is_first = True
+                break
+        else:
+            stack.pop()
+            if is_first or indent is None:
+                yield ']'
+            else:
+                yield '\n' + indent * len(stack) + ']'
+            is_first = False
+
+
+class _TokenRun(list):
+    """
+    consecutive tokens of a list that also holds sublists (see 
+    flatten_nested_list).
+    """
+    pass
+
+
+def flatten_nested_list(input_document):
+    """
+    turns a nested list into a flat representation: the list of its tokens, in 
+    order, and its shape. the shape is an array of ints describing, in 
+    preorder, each list: first its number of entries, then each entry, which 
+    is either a run of consecutive tokens, stored as minus its length, or a 
+    sublist, stored recursively. e.g. [['a', 'b'], 'c', []] has the shape 
+    [3, 1, -2, -1, 0]. tokens can then be counted, hashed or mapped in bulk, 
+    and the nested list rebuilt by unflatten_nested_list.
+    :param input_document: list: a nested list of strings
+    :return: list, array: tokens, shape
+    """
+    tokens, shape = [], array.array('i')
+    is_str = str.__instancecheck__
+    # lists of tokens only, the most common, are flattened by C loops. other 
+    # lists get a frame iterating over their entries: sublists and, if they 
+    # also hold tokens, _TokenRuns
+    stack = [iter([input_document])]
+    while stack:
+        for item in stack[-1]:
+            if type(item) is _TokenRun:
+                tokens.extend(item)
+                shape.append(-len(item))
+                continue
+            if not isinstance(item, list):
+                item = list(item)
+            if all(map(is_str, item)):
+                if item:
+                    shape.extend((1, -len(item)))
+                    tokens.extend(item)
+                else:
+                    shape.append(0)
+                continue
+            if any(map(is_str, item)):
+                entries = []
+                for items_are_tokens, group in itertools.groupby(item, is_str):
+                    if items_are_tokens:
+                        entries.append(_TokenRun(group))
+                    else:
+                        entries.extend(group)
+                item = entries
+            shape.append(len(item))
+            stack.append(iter(item))
+            break
+        else:
+            stack.pop()
+    return tokens, shape
+
+
+def unflatten_nested_list(tokens, shape):
+    """
+    rebuilds a nested list from its flat representation (see 
+    flatten_nested_list).
+    :param tokens: sequence: tokens of the nested list, in order.
+    :param shape: sequence: shape of the nested list.
+    :return: list: the nested list
+    """
+    output_document = []
+    stack = [[output_document, shape[0]]]
+    token_position, shape_position = 0, 1
+    while stack:
+        frame = stack[-1]
+        if not frame[1]:
+            stack.pop()
+            continue
+        frame[1] -= 1
+        code = shape[shape_position]
+        shape_position += 1
+        if code < 0:
+            frame[0].extend(tokens[token_position:token_position - code])
+            token_position -= code
+        elif code == 1 and shape[shape_position] < 0:
+            # a sublist of tokens only, sliced at once
+            code = shape[shape_position]
+            shape_position += 1
+            sublist = tokens[token_position:token_position - code]
+            frame[0].append(sublist if type(sublist) is list else list(sublist))
+            token_position -= code
+        else:
+            sublist = []
+            frame[0].append(sublist)
+            stack.append([sublist, code])
+    return output_document
+
+
+def detect_format(public_path):
+    """
+    :param public_path: str: path of a folder in /public.
+    :return: str: 'jsonl' if the folder holds a packed corpus, else 'json'
+    """
+    if os.path.isfile(os.path.join(public_path, PACKED_INDEX_FILE)):
+        return 'jsonl'
+    return 'json'
+
+
+class JSONFilesWriter:
+    """
+    writes each document to its own {ix}.json file. documents may be written 
+    in any order, and concurrently.
+    """
+    ordered = False
+
+    def __init__(self, public_path, encoding='utf-8', size=None):
+        """
+        :param public_path: str: folder where documents are written.
+        :param encoding: str: encoding of the files.
+        :param size: int: number of documents of the folder to keep, the 
+        following ones being deleted. if None, all are kept.
+        """
+        self.public_path = public_path
+        self.encoding = encoding
+        # number of documents known to be synced to disk, counted on the 
+        # first flush if not given
+        self._synced_size = size
+        if size is not None:
+            ix = size
+            while os.path.isfile(os.path.join(public_path, '{}.json'.format(ix))):
+                os.remove(os.path.join(public_path, '{}.json'.format(ix)))
+                ix += 1
+
+    def write(self, ix, fragments):
+        """
+        :param ix: int: index of the document.
+        :param fragments: bytes or iterable: the document as JSON text 
+        encoded in self.encoding, or as fragments of JSON text.
+        :return: int: number of bytes written
+        """
+        data = _to_encoded(fragments, self.encoding)
+        with open(os.path.join(self.public_path, '{}.json'.format(ix)),
+                  mode='wb') as output:
+            output.write(data)
+        return len(data)
+
+    def flush(self):
+        """
+        makes the documents written so far durable, whether by this writer or 
+        by another one (e.g. in a worker process): the {ix}.json files written 
+        since the previous flush, up to the first missing one, are synced, 
+        and then the folder, so that their names are durable too.
+        :return: None
+        """
+        ix = self._synced_size
+        if ix is None:
+            ix = len(JSONFilesReader(self.public_path))
+        file_path = os.path.join(self.public_path, '{}.json'.format(ix))
+        while os.path.isfile(file_path):
+            with open(file_path, mode='rb') as output:
+                os.fsync(output.fileno())
+            ix += 1
+            file_path = os.path.join(self.public_path, '{}.json'.format(ix))
+        _sync_directory(self.public_path)
+        self._synced_size = ix
+
+    def close(self):
+        pass
+
+
+class JSONFilesReader:
+    """
+    reads documents stored as {ix}.json files.
+    """
+    def __init__(self, public_path, encoding='utf-8', serializer='auto'):
+        """
+        :param public_path: str: folder where documents are stored.
+        :param encoding: str: encoding of the files.
+        :param serializer: str or JSONSerializer: JSON library parsing the 
+        documents (see corpushash.serializers.get_serializer).
+        """
+        self.public_path = public_path
+        self.encoding = encoding
+        self.serializer = get_serializer(serializer, encoding)
+        self.size = sum(1 for file_name in os.listdir(public_path)
+                        if re.match(r'\d+\.json$', file_name))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, ix):
+        if not 0 <= ix < self.size:
+            raise IndexError('document index out of range')
+        with open(os.path.join(self.public_path, '{}.json'.format(ix)),
+                  mode='rb') as hashed_document:
+            return self.serializer.loads(hashed_document.read())
+
+    def __iter__(self):
+        return self.iter_documents()
+
+    def iter_documents(self, start=0, stop=None):
+        """
+        :param start: int: index of the first document.
+        :param stop: int: index after the last document. if None, documents 
+        are read up to the last one.
+        :yield: list: the next document
+        """
+        stop = self.size if stop is None else min(stop, self.size)
+        for ix in range(start, stop):
+            yield self[ix]
+
+    def close(self):
+        pass
+
+
+class PackedWriter:
+    """
+    appends documents to corpus.jsonl, one per line, and the offset where
+    each of them ends to corpus.index. documents must be written in order.
+    """
+    ordered = True
+
+    def __init__(self, public_path, encoding='utf-8', size=None):
+        """
+        :param public_path: str: folder where the packed corpus is written. if
+        it already holds one, documents are appended to it.
+        :param encoding: str: encoding of corpus.jsonl.
+        :param size: int: number of documents of the packed corpus to keep,
+        the following ones being discarded. if None, all are kept.
+        """
+        self.encoding = encoding
+        self.size = PackedReader.count(public_path)
+        if size is not None:
+            self.size = min(size, self.size)
+        self.corpus_file = open(os.path.join(public_path, PACKED_CORPUS_FILE),
+                                mode='ab')
+        # unbuffered: index entries are buffered in _pending_index instead,
+        # and only written once the documents they point to are
+        self.index_file = open(os.path.join(public_path, PACKED_INDEX_FILE),
+                               mode='ab', buffering=0)
+        self._pending_index = bytearray()
+        self.offset = PackedReader.end_offset(public_path, self.size)
+        # discard anything written after the last indexed document (e.g. by
+        # an interrupted run)
+        self.index_file.truncate(self.size * 8)
+        self.corpus_file.truncate(self.offset)
+
+    def write(self, ix, fragments):
+        """
+        :param ix: int: index of the document, the number of documents
+        written so far.
+        :param fragments: bytes or iterable: the document as JSON text 
+        encoded in self.encoding, or as fragments of JSON text, without 
+        newlines.
+        :return: int: number of bytes written
+        """
+        if ix != self.size:
+            raise ValueError('packed documents must be written in order: '
+                             'expected document {}, got {}.'.format(self.size, ix))
+        line = _to_encoded(fragments, self.encoding) + b'\n'
+        self.corpus_file.write(line)
+        self.offset += len(line)
+        self._pending_index += self.offset.to_bytes(8, 'little')
+        if len(self._pending_index) >= INDEX_BUFFER_SIZE:
+            self._write_index()
+        self.size += 1
+        return len(line) + 8
+
+    def _write_index(self):
+        """
+        writes the pending index entries, after the documents they point to,
+        so that the index on disk is never ahead of corpus.jsonl, even if the
+        process dies.
+        :return: None
+        """
+        self.corpus_file.flush()
+        if self._pending_index:
+            self.index_file.write(self._pending_index)
+            self._pending_index.clear()
+
+    def flush(self):
+        """
+        makes the documents written so far durable: corpus.jsonl is synced
+        before the index that points into it.
+        :return: None
+        """
+        self._write_index()
+        for output in (self.corpus_file, self.index_file):
+            os.fsync(output.fileno())
+
+    def close(self):
+        self._write_index()
+        self.corpus_file.close()
+        self.index_file.close()
+
+
+class PackedReader:
+    """
+    reads a packed corpus. iterating over it reads corpus.jsonl sequentially
+    with large buffered reads; indexing it reads a single document, located
+    through the offsets in corpus.index, from a memory map of corpus.jsonl.
+    """
+    def __init__(self, public_path, encoding='utf-8', serializer='auto'):
+        """
+        :param public_path: str: folder where the packed corpus is stored.
+        :param encoding: str: encoding of corpus.jsonl.
+        :param serializer: str or JSONSerializer: JSON library parsing the 
+        documents (see corpushash.serializers.get_serializer).
+        """
+        self.corpus_path = os.path.join(public_path, PACKED_CORPUS_FILE)
+        self.encoding = encoding
+        self._loads = get_serializer(serializer, encoding).loads
+        self.offsets = self.read_offsets(public_path)
+        self._file = None
+        self._mmap = None
+
+    @staticmethod
+    def read_offsets(public_path):
+        """
+        :param public_path: str: folder where the packed corpus is stored.
+        :return: array: offset where each document ends. offsets past the end
+        of corpus.jsonl (left by a process that died before writing the
+        documents they point to) are discarded.
+        """
+        offsets = array.array('Q')
+        index_path = os.path.join(public_path, PACKED_INDEX_FILE)
+        if os.path.isfile(index_path):
+            with open(index_path, mode='rb') as index_file:
+                index = index_file.read()
+            offsets.frombytes(index[:len(index) - len(index) % 8])
+            if sys.byteorder == 'big':
+                offsets.byteswap()
+            corpus_size = _file_size(os.path.join(public_path,
+                                                  PACKED_CORPUS_FILE))
+            if offsets and offsets[-1] > corpus_size:
+                del offsets[bisect.bisect_right(offsets, corpus_size):]
+        return offsets
+
+    @staticmethod
+    def count(public_path):
+        """
+        :param public_path: str: folder where the packed corpus is stored.
+        :return: int: number of documents (whose offsets are in corpus.jsonl)
+        """
+        index_path = os.path.join(public_path, PACKED_INDEX_FILE)
+        if not os.path.isfile(index_path):
+            return 0
+        size = os.path.getsize(index_path) // 8
+        if size:
+            with open(index_path, mode='rb') as index_file:
+                index_file.seek((size - 1) * 8)
+                last_offset = int.from_bytes(index_file.read(8), 'little')
+            if last_offset > _file_size(os.path.join(public_path,
+                                                     PACKED_CORPUS_FILE)):
+                return len(PackedReader.read_offsets(public_path))
+        return size
+
+    @staticmethod
+    def end_offset(public_path, size=None):
+        """
+        :param public_path: str: folder where the packed corpus is stored.
+        :param size: int: number of documents to consider. if None, all are.
+        :return: int: offset where the last document ends
+        """
+        index_path = os.path.join(public_path, PACKED_INDEX_FILE)
+        if size is None:
+            size = PackedReader.count(public_path)
+        if not size:
+            return 0
+        with open(index_path, mode='rb') as index_file:
+            index_file.seek((size - 1) * 8)
+            return int.from_bytes(index_file.read(8), 'little')
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, ix):
+        if not 0 <= ix < len(self.offsets):
+            raise IndexError('document index out of range')
+        if self._mmap is None:
+            self._file = open(self.corpus_path, mode='rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        start = self.offsets[ix - 1] if ix else 0
+        return self._loads(self._mmap[start:self.offsets[ix]])
+
+    def __iter__(self):
+        return self.iter_documents()
+
+    def iter_documents(self, start=0, stop=None):
+        """
+        reads documents sequentially from corpus.jsonl.
+        :param start: int: index of the first document.
+        :param stop: int: index after the last document. if None, documents 
+        are read up to the last one.
+        :yield: list: the next document
+        """
+        stop = len(self.offsets) if stop is None else min(stop, 
+                                                          len(self.offsets))
+        if start >= stop:
+            return
+        with open(self.corpus_path, mode='rb',
+                  buffering=READ_BUFFER_SIZE) as corpus_file:
+            if start:
+                corpus_file.seek(self.offsets[start - 1])
+            for _ in range(start, stop):
+                yield self._loads(corpus_file.readline())
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap, self._file = None, None
+
+
+def _to_encoded(fragments, encoding):
+    """
+    :param fragments: bytes or iterable: encoded JSON text, or fragments of 
+    JSON text.
+    :param encoding: str: encoding of the fragments.
+    :return: bytes: the encoded JSON text
+    """
+    if isinstance(fragments, bytes):
+        return fragments
+    return ''.join(fragments).encode(encoding)
+
+
+def _sync_directory(directory_path):
+    """
+    syncs a directory, so that the files created in it are durable (where the 
+    platform allows it).
+    :param directory_path: str: path of the directory.
+    :return: None
+    """
+    if os.name != 'posix':
+        return
+    fd = os.open(directory_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _file_size(file_path):
+    """
+    :return: int: size of the file in bytes, 0 if it does not exist
+    """
+    return os.path.getsize(file_path) if os.path.isfile(file_path) else 0
+
+
+def _read_array(file_path, typecode, start, stop):
+    """
+    reads items start to stop of a file holding a little-endian array.
+    """
+    items = array.array(typecode)
+    with open(file_path, mode='rb') as array_file:
+        array_file.seek(start * items.itemsize)
+        items.frombytes(array_file.read((stop - start) * items.itemsize))
+    if sys.byteorder == 'big':
+        items.byteswap()
+    return items
+
+
+def _to_bytes(items):
+    """
+    :param items: array: array to be stored.
+    :return: bytes: the array, little-endian
+    """
+    if sys.byteorder == 'big':
+        items = array.array(items.typecode, items)
+        items.byteswap()
+    return items.tobytes()
+
+
+class IdsWriter:
+    """
+    stores documents as arrays of integer ids in the ids/ subfolder of a 
+    /public folder. each distinct hashed token gets a dense id, in order of 
+    first appearance; vocabulary.txt holds the hashed tokens, the one in line 
+    i having id i. tokens.bin and shapes.bin hold the concatenated token ids 
+    (uint32) and shapes (int32, see flatten_nested_list) of the documents, and 
+    index.bin holds, for each document, where its token ids and its shape end 
+    (counted in items) and where vocabulary.txt ended when it was written (in 
+    bytes), as three uint64. all files are little-endian and written 
+    in append mode, so documents can be added to a previous hashing. documents 
+    must be written in order, though ids may be assigned to new tokens (by 
+    token_id) in another thread than the one writing.
+    """
+    ordered = True
+
+    def __init__(self, public_path, size=None):
+        """
+        :param public_path: str: folder in /public where the ids/ subfolder is 
+        (to be) stored.
+        :param size: int: number of documents to keep, the following ones 
+        being discarded. if None, all are kept.
+        """
+        ids_path = os.path.join(public_path, IDS_FOLDER)
+        os.makedirs(ids_path, exist_ok=True)
+        reader = IdsReader(public_path)
+        self.size = len(reader) if size is None else min(size, len(reader))
+        vocabulary = reader.vocabulary()
+        self.token_ids = {hashed_token: token_id for token_id, hashed_token 
+                          in enumerate(vocabulary)}
+        token_end, shape_end, _ = (reader.ends(self.size - 1) if self.size 
+                                   else (0, 0, 0))
+        # a vocabulary entry cut by an interrupted run is discarded too
+        vocabulary_end = sum(len(hashed_token.encode()) + 1 
+                             for hashed_token in vocabulary)
+        files = []
+        for file_name, item_size, end in ((IDS_VOCABULARY_FILE, 1, vocabulary_end), 
+                                          (IDS_TOKENS_FILE, 4, token_end), 
+                                          (IDS_SHAPES_FILE, 4, shape_end), 
+                                          (IDS_INDEX_FILE, 24, self.size)):
+            # the index is unbuffered: its entries are buffered in 
+            # _pending_index instead, and only written once the rest is
+            output = open(os.path.join(ids_path, file_name), mode='ab', 
+                          buffering=0 if file_name == IDS_INDEX_FILE else -1)
+            # discard anything written after the last indexed document
+            output.truncate(end * item_size)
+            files.append(output)
+        (self.vocabulary_file, self.tokens_file, self.shapes_file, 
+                                                    self.index_file) = files
+        self._pending_index = bytearray()
+        self.token_end, self.shape_end = token_end, shape_end
+        self.vocabulary_end = vocabulary_end
+        self._vocabulary_bytes = 0
+        self._lock = threading.Lock()
+
+    def token_id(self, hashed_token):
+        """
+        :param hashed_token: str: hashed token.
+        :return: int: its id, assigned now if it is new
+        """
+        try:
+            return self.token_ids[hashed_token]
+        except KeyError:
+            token_id = self.token_ids[hashed_token] = len(self.token_ids)
+            vocabulary_bytes = self.vocabulary_file.write(
+                                                hashed_token.encode() + b'\n')
+            with self._lock:
+                self._vocabulary_bytes += vocabulary_bytes
+                self.vocabulary_end += vocabulary_bytes
+            return token_id
+
+    def write(self, ix, token_ids, shape):
+        """
+        :param ix: int: index of the document, the number of documents 
+        written so far.
+        :param token_ids: array: ids of the document's tokens (typecode 'I').
+        :param shape: array: shape of the document (typecode 'i').
+        :return: int: number of bytes written, including the vocabulary 
+        entries of the tokens that got their ids since the previous document
+        """
+        if ix != self.size:
+            raise ValueError('documents must be written in order: '
+                             'expected document {}, got {}.'.format(self.size, ix))
+        with self._lock:
+            bytes_written, self._vocabulary_bytes = self._vocabulary_bytes + 24, 0
+            # the ids of the document's tokens were given before it is 
+            # written, so they are all before this end
+            vocabulary_end = self.vocabulary_end
+        bytes_written += (self.tokens_file.write(_to_bytes(token_ids)) + 
+                          self.shapes_file.write(_to_bytes(shape)))
+        self.token_end += len(token_ids)
+        self.shape_end += len(shape)
+        self._pending_index += (self.token_end.to_bytes(8, 'little') + 
+                                self.shape_end.to_bytes(8, 'little') + 
+                                vocabulary_end.to_bytes(8, 'little'))
+        if len(self._pending_index) >= INDEX_BUFFER_SIZE:
+            self._write_index()
+        self.size += 1
+        return bytes_written
+
+    def _write_index(self):
+        """
+        writes the pending index entries after the vocabulary, token ids and 
+        shapes they cover, so that the index on disk is never ahead of them, 
+        even if the process dies.
+        :return: None
+        """
+        for output in (self.vocabulary_file, self.tokens_file, 
+                       self.shapes_file):
+            output.flush()
+        if self._pending_index:
+            self.index_file.write(self._pending_index)
+            self._pending_index.clear()
+
+    def flush(self):
+        """
+        makes the documents written so far durable, the vocabulary first and 
+        the index last.
+        :return: None
+        """
+        self._write_index()
+        for output in (self.vocabulary_file, self.tokens_file, 
+                       self.shapes_file, self.index_file):
+            os.fsync(output.fileno())
+
+    def close(self):
+        self._write_index()
+        for output in (self.vocabulary_file, self.tokens_file, 
+                       self.shapes_file, self.index_file):
+            output.close()
+
+
+class IdsReader:
+    """
+    reads documents stored as integer ids (see IdsWriter). no string is 
+    parsed to read a document: its token ids and shape are read as arrays.
+    """
+    def __init__(self, public_path):
+        """
+        :param public_path: str: folder in /public holding the ids/ subfolder.
+        """
+        self.ids_path = os.path.join(public_path, IDS_FOLDER)
+        self.size = self._count_documents()
+
+    def _count_documents(self):
+        """
+        counts the indexed documents whose token ids, shapes and vocabulary 
+        entries are all stored. the documents after them were left by a 
+        process that died before writing these.
+        :return: int: number of documents
+        """
+        index_path = os.path.join(self.ids_path, IDS_INDEX_FILE)
+        size = _file_size(index_path) // 24
+        if not size:
+            return 0
+        ends = _read_array(index_path, 'Q', 0, 3 * size)
+        for column, (file_name, item_size) in enumerate((
+                    (IDS_TOKENS_FILE, 4), (IDS_SHAPES_FILE, 4), 
+                    (IDS_VOCABULARY_FILE, 1))):
+            stored = _file_size(os.path.join(self.ids_path, file_name)) // item_size
+            size = min(size, bisect.bisect_right(ends[column::3], stored))
+        return size
+
+    def __len__(self):
+        return self.size
+
+    def vocabulary(self):
+        """
+        :return: list: the hashed tokens, indexed by their ids
+        """
+        vocabulary_path = os.path.join(self.ids_path, IDS_VOCABULARY_FILE)
+        if not os.path.isfile(vocabulary_path):
+            return []
+        with open(vocabulary_path, mode='rb') as vocabulary_file:
+            return vocabulary_file.read().decode().split('\n')[:-1]
+
+    def ends(self, ix):
+        """
+        :param ix: int: index of the document.
+        :return: int, int, int: where its token ids and its shape end, in 
+        items, and where the vocabulary ended when it was written, in bytes
+        """
+        return tuple(_read_array(os.path.join(self.ids_path, IDS_INDEX_FILE), 
+                                 'Q', 3 * ix, 3 * ix + 3))
+
+    def __getitem__(self, ix):
+        """
+        :param ix: int: index of the document.
+        :return: array, array: token ids and shape of the document (see 
+        unflatten_nested_list to rebuild it as a nested list of ids)
+        """
+        if not 0 <= ix < self.size:
+            raise IndexError('document index out of range')
+        token_start, shape_start, _ = self.ends(ix - 1) if ix else (0, 0, 0)
+        token_end, shape_end, _ = self.ends(ix)
+        return (_read_array(os.path.join(self.ids_path, IDS_TOKENS_FILE), 
+                            'I', token_start, token_end), 
+                _read_array(os.path.join(self.ids_path, IDS_SHAPES_FILE), 
+                            'i', shape_start, shape_end))
+
+    def __iter__(self):
+        if not self.size:
+            return
+        ends = _read_array(os.path.join(self.ids_path, IDS_INDEX_FILE), 'Q', 
+                           0, 3 * self.size)
+        with open(os.path.join(self.ids_path, IDS_TOKENS_FILE), mode='rb', 
+                  buffering=READ_BUFFER_SIZE) as tokens_file, \
+             open(os.path.join(self.ids_path, IDS_SHAPES_FILE), mode='rb', 
+                  buffering=READ_BUFFER_SIZE) as shapes_file:
+            token_start, shape_start = 0, 0
+            for ix in range(self.size):
+                token_ids, shape = array.array('I'), array.array('i')
+                token_ids.frombytes(tokens_file.read(
+                                4 * (ends[3 * ix] - token_start)))
+                shape.frombytes(shapes_file.read(
+                                4 * (ends[3 * ix + 1] - shape_start)))
+                if sys.byteorder == 'big':
+                    token_ids.byteswap()
+                    shape.byteswap()
+                token_start, shape_start = ends[3 * ix], ends[3 * ix + 1]
+                yield token_ids, shape
+
+    def close(self):
+        pass
+
+
+class BackgroundWriter:
+    """
+    wraps a writer (of any format, or an IdsWriter) so that documents are 
+    written by background threads, while the calling thread goes on hashing 
+    the next ones. documents wait to be written in a bounded queue: when it 
+    is full, write blocks until a thread takes a document from it 
+    (backpressure). ordered writers get a single thread, so documents are 
+    written in the order they are queued. an exception raised while writing 
+    a document is raised again by the next call to write, or by close; the 
+    documents queued after it are not written.
+       other attributes (e.g. token_id) are those of the wrapped writer, and 
+    are used synchronously.
+    """
+    def __init__(self, writer, threads=1, max_pending=None):
+        """
+        :param writer: writer to be wrapped.
+        :param threads: int: number of writing threads, if the writer is not 
+        ordered.
+        :param max_pending: int: number of documents that may wait to be 
+        written. defaults to four per thread.
+        """
+        self.writer = writer
+        if getattr(writer, 'ordered', True):
+            threads = 1
+        self.queue = queue.Queue(maxsize=max_pending or 4 * threads)
+        self.bytes_written = 0
+        self._error = None
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._write_queued, daemon=True) 
+                         for _ in range(threads)]
+        for thread in self._threads:
+            thread.start()
+
+    def _write_queued(self):
+        while True:
+            args = self.queue.get()
+            if args is None:
+                return
+            try:
+                if self._error is None:
+                    bytes_written = self.writer.write(*args)
+                    with self._lock:
+                        self.bytes_written += bytes_written
+            except BaseException as error:
+                self._error = error
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, *args):
+        """
+        queues a document to be written.
+        :param args: the arguments of the write method of the wrapped writer.
+        :return: int: 0, as bytes are counted in bytes_written once written
+        """
+        self._raise_error()
+        self.queue.put(args)
+        return 0
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def flush(self):
+        """
+        waits for the queued documents to be written, and flushes the wrapped 
+        writer.
+        :return: None
+        """
+        self.queue.join()
+        self._raise_error()
+        self.writer.flush()
+
+    def close(self):
+        """
+        waits for the queued documents to be written, and closes the wrapped 
+        writer.
+        :return: None
+        """
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self.writer.close()
+        self._raise_error()
+
+
+WRITERS = {'json': JSONFilesWriter, 'jsonl': PackedWriter}
+READERS = {'json': JSONFilesReader, 'jsonl': PackedReader}
+
+
+def count_documents(public_path):
+    """
+    :param public_path: str: path of a folder in /public.
+    :return: int: number of hashed documents in the folder
+    """
+    if detect_format(public_path) == 'jsonl':
+        return PackedReader.count(public_path)
+    return len(JSONFilesReader(public_path))
+
+
+def open_reader(public_path, encoding='utf-8', serializer='auto'):
+    """
+    opens a reader for the hashed documents in a /public folder, whatever
+    their format.
+    :param public_path: str: path of the folder.
+    :param encoding: str: encoding of the files.
+    :param serializer: str or JSONSerializer: JSON library parsing the 
+    documents (see corpushash.serializers.get_serializer).
+    :return: JSONFilesReader or PackedReader
+    """
+    return READERS[detect_format(public_path)](public_path, encoding=encoding, 
+                                               serializer=serializer)
@@ -1,11 +1,24 @@
 import os
 import hashlib
+import hmac
 import pickle
-import copy
 import json
 import base64
 import datetime
+import time
 import logging
+import itertools
+import array
+import multiprocessing
+
+from corpushash.dictionaries import DICTIONARY_BACKENDS, write_atomically
+from corpushash.instrumentation import HashingStats
+from corpushash.serializers import get_serializer
+from corpushash.tokenizers import tokenize_lines, _imap_bounded
+from corpushash.formats import (WRITERS, IdsWriter, IdsReader, BackgroundWriter, 
+                                iter_hashed_json, detect_format, count_documents, 
+                                open_reader, flatten_nested_list, 
+                                unflatten_nested_list)
 
 
 logger = logging.getLogger(__name__)
@@ -29,14 +42,24 @@ class CorpusHash:
     """
     def __init__(self, corpus, corpus_path, hash_function='sha256', 
                  salt_length=32, one_salt=False, encoding='utf-8', 
-                 indent_json=None):
+                 indent_json=None, workers=None, chunk_size=1000, 
+                 dictionary_backend='json', append=False, output_format='json', 
+                 integer_ids=False, key=None, store_dictionaries=True, 
+                 stats=None, serializer='auto', write_threads=None, 
+                 checkpoint_every=None, checkpoint_interval=None, resume=False, 
+                 dictionary_cache_memory=None):
         """
         takes as corpus a dictionary of nested lists of a variable depth, and 
         hashes its tokens with a random salt. the corpus_path provided is 
         created if not existent. the dictionary and hashed corpus paths are 
         built from the provided corpus_path
-        :param corpus: list: nested list, whose elements are themselves nested 
-        lists of tokens to be encoded (hashed).
+        :param corpus: iterable: nested list, whose elements are themselves 
+        nested lists of tokens to be encoded (hashed). it may also be any 
+        iterable of documents, such as a generator or the readers 
+        read_json_documents and read_jsonl_corpus, in which case documents are 
+        processed as they are read, and only the vocabulary dictionaries and 
+        the current document (or batch of documents, if workers > 1) are kept 
+        in memory. note that a generator is exhausted after hashing.
         :param corpus_path: str: defines where outputted files are to be stored.
         :param hash_function: str: defines which hash function to use in the 
         encoding process (the ones available are from the hashlib).
@@ -52,40 +75,203 @@ class CorpusHash:
         indentation. if you don't have nested lists, the default argument (None)
         is probably the best option, for with large corpora indentation and \\n 
         can take up a lot of space.
+        :param workers: int: number of processes used to hash the corpus. if 
+        None or 1, the corpus is hashed serially in the current process.
+        :param chunk_size: int: number of documents sent to a worker process 
+        at a time. only used if workers is greater than 1.
+        :param dictionary_backend: str or class: how the en(de)coding 
+        dictionaries are stored in /private. 'json' (the default) keeps them in 
+        memory and rewrites two .json files after each hashing. 'sqlite' keeps 
+        them in an SQLite database, so that only the tokens looked up are read 
+        and only new tokens are written, which makes hashing a few documents 
+        against a large vocabulary cheap. a class with the same interface as 
+        the ones in corpushash.dictionaries may also be given.
+        :param append: bool or str: if False, the hashed documents are written 
+        to a new folder in /public. if True, they are appended to the latest 
+        folder in /public (or to the folder whose name is given as a str): 
+        documents already hashed to it (identified by a fingerprint of their 
+        content, kept in /private) are skipped, and the others are numbered 
+        after the ones already there. fingerprints are only taken when hashing 
+        with append or with checkpoints, so hash the first documents of a 
+        folder with append=True too if more are to be appended to it.
+        :param output_format: str: 'json' writes each hashed document to its 
+        own {ix}.json file. 'jsonl' packs all documents in a single JSON-lines 
+        file, corpus.jsonl, with an index of their offsets, corpus.index, which 
+        saves inodes and syscalls on large corpora and allows random access to 
+        any document (see read_hashed_document). indent_json is ignored for 
+        the documents in this format.
+        :param integer_ids: bool: if True, the hashed documents are also stored 
+        as arrays of integer ids in an ids/ folder in /public, along with a 
+        dense mapping of ids to hashed tokens, so that consumers can load them 
+        without parsing any string (see read_id_corpus and 
+        corpushash.formats.IdsWriter).
+        :param key: bytes or bool: if given, tokens are hashed with this secret 
+        key (HMAC of the hash function, or the keyed mode of blake2b and 
+        blake2s) instead of a salt. hashing then needs no shared state: any 
+        worker or machine with the key hashes a token to the same hash. if 
+        True, the key is read from /private/hash.key, where a new random key is 
+        saved if there is none. salt_length and one_salt are ignored.
+        :param store_dictionaries: bool: if False (only allowed along with 
+        key), the en(de)coding dictionaries are neither loaded nor stored, so 
+        that hashing keeps no state at all. the hashed corpus can't be decoded 
+        then, except by hashing candidate tokens with the key.
+        :param stats: HashingStats: collects the counters (documents, tokens, 
+        new and cached tokens, collisions, bytes written) and timings of the 
+        hashing, and may report its progress to a callback or profile it (see 
+        corpushash.instrumentation). if None, a new one is created. either way, 
+        it is kept as self.stats.
+        :param serializer: str: JSON library used to write and read the hashed 
+        documents and the .json dictionaries: 'orjson', 'ujson' or 'json' (the 
+        standard library). 'auto' picks the first of them that is installed. 
+        they all write the same JSON values, so the choice only affects speed, 
+        though orjson and ujson leave out the whitespace after separators (see 
+        corpushash.serializers).
+        :param write_threads: int: if given, hashed documents are written to 
+        disk by this many background threads, so that hashing and writing 
+        overlap (the 'jsonl' output format and the integer ids, which are 
+        written in order, get a single thread each). a few documents per 
+        thread may wait to be written; hashing waits when there are more. an 
+        error raised while writing is raised again by hash_corpus.
+        :param checkpoint_every: int: if given, a checkpoint is made every 
+        checkpoint_every documents: the documents written so far are flushed, 
+        the tokens added to the en(de)coding dictionaries since the previous 
+        checkpoint are stored, and the progress of the hashing is recorded in 
+        /private/checkpoint.json, so that an interrupted hashing can be 
+        resumed (see resume). all of it is written atomically.
+        :param checkpoint_interval: float: if given, a checkpoint is made 
+        (at least) every checkpoint_interval seconds.
+        :param resume: bool: if True and an interrupted hashing left a 
+        checkpoint, it is resumed: the documents are written to the same 
+        folder in /public, after the ones hashed until the checkpoint, and 
+        the documents of the corpus hashed until then are skipped. corpus must 
+        be the same as in the interrupted hashing, and so must the other 
+        arguments. if there is no checkpoint, the corpus is hashed as usual.
+        :param dictionary_cache_memory: int: memory budget, in bytes, of the 
+        cache of the most recently used tokens of the encode dictionary kept 
+        by the 'sqlite' dictionary backend, so that memory use stays bounded 
+        however large the vocabulary (see 
+        corpushash.dictionaries.CachedDictionary). 0 disables the cache. if 
+        None, the backend's default (64 MiB) is used. the hits and misses of 
+        the cache are counted in stats.
         """
         self.corpus = corpus
         if not os.path.isdir(corpus_path):
             os.mkdir(corpus_path)
         self.corpus_path = corpus_path
+        self.append = append
+        self.checkpoint_path = os.path.join(self.corpus_path, 'private', 
+                                            'checkpoint.json')
+        self._checkpoint = self._load_checkpoint() if resume else None
         self.public_path = self._make_public_dir()
+        self.fingerprints_path = os.path.join(
+                            self.corpus_path, 'private', 'fingerprints', 
+                            '{}.txt'.format(os.path.basename(self.public_path)))
+        if self._checkpoint is not None:
+            if (self._checkpoint['output_format'], 
+                    self._checkpoint['integer_ids']) != (output_format, 
+                                                         integer_ids):
+                raise ValueError('can not resume the hashing to {}: it had '
+                                 'output_format={!r} and integer_ids={}.'.format(
+                                            self.public_path, 
+                                            self._checkpoint['output_format'], 
+                                            self._checkpoint['integer_ids']))
+            self.start_index = self._checkpoint['documents']
+        else:
+            self.start_index = count_documents(self.public_path)
+        if output_format not in WRITERS:
+            raise ValueError('output format {} not available. choose one of '
+                             '{}.'.format(output_format, sorted(WRITERS)))
+        if self.start_index and detect_format(self.public_path) != output_format:
+            raise ValueError('can not append to {}: its documents are not in '
+                             'the {} format.'.format(self.public_path, 
+                                                     output_format))
+        self.output_format = output_format
+        if (self.start_index and self._checkpoint is None and 
+                len(IdsReader(self.public_path)) != (self.start_index 
+                                                     if integer_ids else 0)):
+            raise ValueError('can not append to {}: integer_ids must be {}, as '
+                             'for its previous documents.'.format(
+                                        self.public_path, not integer_ids))
+        self.integer_ids = integer_ids
+        self._decode_lookup = None
+        self._reader = None
         self.encoding = encoding
+        self.indent_json = indent_json
+        self.serializer = get_serializer(serializer, encoding)
         self.encode_dictionary_path = os.path.join(self.corpus_path, 
                                                 'private/encode_dictionary.json')
         self.decode_dictionary_path = os.path.join(self.corpus_path, 
                                                 'private/decode_dictionary.json')
-        (self.encode_dictionary, 
-                             self.decode_dictionary) = self._load_dictionaries()
-        self.encoding = encoding
+        if isinstance(dictionary_backend, str):
+            if dictionary_backend not in DICTIONARY_BACKENDS:
+                raise ValueError('dictionary backend {} not available. choose '
+                                 'one of {}.'.format(dictionary_backend, 
+                                                     sorted(DICTIONARY_BACKENDS)))
+            dictionary_backend = DICTIONARY_BACKENDS[dictionary_backend]
+        store_options = {}
+        if dictionary_cache_memory is not None:
+            store_options['cache_memory'] = dictionary_cache_memory
+        self.dictionary_store = dictionary_backend(
+                                    os.path.join(self.corpus_path, 'private'), 
+                                    encoding=self.encoding, 
+                                    indent_json=self.indent_json, 
+                                    serializer=self.serializer, 
+                                    **store_options)
         if hash_function not in hashlib.algorithms_available:
             raise Exception('hash function {} not available on this computer. '
         'choose another from hashlib.algorithms_available.'.format(hash_function))
-        else:
-            self.hash_function = hash_function
+        if key is not None and one_salt:
+            raise ValueError('tokens can be hashed either with a key or with '
+                             'one salt, not both.')
+        if not store_dictionaries and key is None:
+            raise ValueError('dictionaries can only be left unstored when '
+                             'hashing with a key.')
+        self.key = self._load_key(key)
+        self.store_dictionaries = store_dictionaries
+        (self.encode_dictionary, 
+                             self.decode_dictionary) = self._load_dictionaries()
+        self.hash_function = hash_function
+        self._check_hash_mode()
         self.salt_length = salt_length
         self.one_salt = self.choose_salt(one_salt)
-        self.indent_json = indent_json
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.write_threads = write_threads
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.stats = stats if stats is not None else HashingStats()
         self.corpus_size = self.hash_corpus()
 
     def _make_public_dir(self):
         """
         creates folder in /public where output files will be stored. for each 
         instance of CorpusHash using the same corpus_path, a folder will be 
-        created using the current time as its name.
+        created using the current time as its name. if self.append is set, the 
+        latest folder (or the one named by self.append) is reused instead, and 
+        when resuming, the folder of the checkpoint.
         :return: str: public_hash_path, the folder created
         """
         public_dir_path = os.path.join(self.corpus_path, 'public')
         if not os.path.isdir(public_dir_path):
             os.mkdir(public_dir_path)
+        if self._checkpoint is not None:
+            return os.path.join(public_dir_path, 
+                                self._checkpoint['public_folder'])
+        if isinstance(self.append, str):
+            public_hash_path = os.path.join(public_dir_path, 
+                                            os.path.basename(self.append))
+            if not os.path.isdir(public_hash_path):
+                raise FileNotFoundError('no hashed corpus to append to at '
+                                        '{}.'.format(public_hash_path))
+            return public_hash_path
+        elif self.append:
+            previous_hashings = sorted(folder for folder 
+                                       in os.listdir(public_dir_path) 
+                                       if os.path.isdir(os.path.join(
+                                                    public_dir_path, folder)))
+            if previous_hashings:
+                return os.path.join(public_dir_path, previous_hashings[-1])
+            logger.info('no hashed corpus to append to. creating a new one.')
         current_time = datetime.datetime.now()
         public_hash_path = os.path.join(self.corpus_path, 'public', 
                                      current_time.strftime('%Y-%m-%d_%H-%M-%S-%f'))
@@ -99,24 +285,59 @@ class CorpusHash:
         document to the corpus, but do not want to hash it all over again). if 
         there are no dictionaries, creates the folders where they'll be saved 
         to after the corpus is hashed, and returns their skeletons (empty 
-        dictionaries).
-        :return: dict, dict: encode_dictionary, decode_dictionary
+        dictionaries). loading is delegated to self.dictionary_store.
+        :return: dict, dict: encode_dictionary, decode_dictionary (or mappings 
+        with the same interface, depending on the dictionary backend)
         """
-        if (os.path.isfile(self.encode_dictionary_path) and 
-            os.path.isfile(self.decode_dictionary_path)):
+        if not self.store_dictionaries:
+            return {}, {}
+        try:
+            os.mkdir(os.path.join(self.corpus_path, 'private'))
+        except FileExistsError:
+            pass
+        if self.dictionary_store.exists():
             logger.info('dictionaries from previous hashing found. '
                          'loading them.')
-            with open(self.encode_dictionary_path, 'rt') as f:
-                encode_dictionary = json.load(f, encoding=self.encoding)
-            with open(self.decode_dictionary_path, 'rt') as f:
-                decode_dictionary = json.load(f, encoding=self.encoding)
-        else:
-            encode_dictionary, decode_dictionary = {}, {}
-            try:
-                os.mkdir(os.path.join(self.corpus_path, 'private'))
-            except FileExistsError:
-                pass
-        return encode_dictionary, decode_dictionary
+        return self.dictionary_store.load()
+
+    def _load_key(self, key):
+        """
+        :param key: bytes or bool or None: the key argument.
+        :return: bytes or None: the secret key, read from (or created in) 
+        /private/hash.key if key is True
+        """
+        if key is True:
+            os.makedirs(os.path.join(self.corpus_path, 'private'), exist_ok=True)
+            key_path = os.path.join(self.corpus_path, 'private', 'hash.key')
+            if not os.path.isfile(key_path):
+                logger.info('saving a new random key to {}.'.format(key_path))
+                key_file = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 
+                                   0o600)
+                with os.fdopen(key_file, 'wb') as f:
+                    f.write(os.urandom(32))
+            with open(key_path, 'rb') as f:
+                return f.read()
+        elif key is None or isinstance(key, bytes):
+            return key
+        raise TypeError('key must be bytes or True.')
+
+    def _check_hash_mode(self):
+        """
+        checks that the loaded dictionaries were built in the same mode (with 
+        salts or with a key) and, if hashing with a key, with the same key, 
+        by rehashing one of their tokens.
+        :return: None
+        """
+        if not any(self.encode_dictionary):
+            return
+        hashed_token, (token, salt) = next(iter(self.decode_dictionary.items()))
+        if self.key is None and salt is None:
+            raise ValueError('the dictionaries in /private were built with a '
+                             'key, which must be given to keep hashing.')
+        elif self.key is not None and (salt is not None or hashed_token != 
+                      keyed_hash_token(token, self.key, self.hash_function)):
+            raise ValueError('the dictionaries in /private were not built with '
+                             'this key.')
 
     def choose_salt(self, one_salt):
         """
@@ -140,39 +361,443 @@ class CorpusHash:
     def hash_corpus(self):
         """
         for each document in the corpus, hashes it according to class arguments, 
-        saving its hashed form as a .json in /public, and saving the encode and 
-        decode dictionaries to /private.
-        :return: True(1) if successful
-        """
-        for ix, document in enumerate(self.corpus):
-            output_document = copy.deepcopy(document)  # copying here because the next method is recursive
-            encoded_document = self._hash_document(document, output_document)
-            encoded_document_path = os.path.join(self.public_path, 
-                                                 '{}.json'.format(ix))
-            self._export_work(encoded_document, encoded_document_path)
-        corpus_size = ix + 1
-        self._export_work(self.encode_dictionary, self.encode_dictionary_path)
-        self._export_work(self.decode_dictionary, self.decode_dictionary_path)
-        logger.info('{} documents hashed and saved to {}.'.format(corpus_size, 
-                                                os.path.join(self.public_path)))
+        saving its hashed form in /public (in self.output_format), and saving 
+        the encode and decode dictionaries to /private. the corpus is iterated 
+        over only once, 
+        so it may be a generator.
+        :return: int: number of documents in the public folder
+        """
+        # the documents are about to change, so the reader is reopened later
+        self._close_reader()
+        if self._checkpoint is None:
+            # documents may have been hashed to the folder since it was counted
+            self.start_index = count_documents(self.public_path)
+        # documents past start_index (written after the checkpoint, when 
+        # resuming) are discarded, and the writers know which ones to sync
+        size = self.start_index
+        writer = WRITERS[self.output_format](self.public_path, 
+                                             encoding=self.encoding, size=size)
+        ids_writer = None
+        if self.integer_ids:
+            ids_writer = IdsWriter(self.public_path, size=size)
+        if self.write_threads:
+            writer = BackgroundWriter(writer, self.write_threads)
+            if ids_writer is not None:
+                ids_writer = BackgroundWriter(ids_writer)
+        stats = self.stats
+        self._checkpointed_size = self.start_index
+        self._checkpointed_at = time.monotonic()
+        cache_counts = self._cache_counts()
+        # fingerprints of the documents taken from the corpus, (index, 
+        # fingerprint), and of the documents written but not saved yet
+        self._taken_fingerprints, self._written_fingerprints = [], []
+        stats.start()
+        try:
+            try:
+                if self.workers is not None and self.workers > 1:
+                    corpus_size = self._hash_corpus_parallel(writer, ids_writer)
+                else:
+                    corpus_size = self._hash_corpus_serial(writer, ids_writer)
+            finally:
+                with stats.timer('writing'):
+                    self._close_writers(writer, ids_writer)
+            with stats.timer('writing'):
+                if self.store_dictionaries:
+                    self.dictionary_store.flush()
+                self._save_fingerprints()
+        except BaseException:
+            # release the store (e.g. the lock of an SQLite database), so that 
+            # the hashing can be resumed
+            self.dictionary_store.close()
+            raise
+        finally:
+            for name, count, previous_count in zip(
+                        ('cache_hits', 'cache_misses'), self._cache_counts(), 
+                        cache_counts):
+                setattr(stats, name, getattr(stats, name) + count - 
+                                     previous_count)
+            stats.stop()
+        if ((self._checkpoint is not None or self._checkpoints_enabled()) and 
+                os.path.isfile(self.checkpoint_path)):
+            # the hashing is complete, nothing to resume
+            os.remove(self.checkpoint_path)
+        self._checkpoint = None
+        logger.info('{} documents hashed and saved to {}.'.format(
+                                        corpus_size - self.start_index, 
+                                        os.path.join(self.public_path)))
+        return corpus_size
+
+    def _cache_counts(self):
+        """
+        :return: tuple: hits and misses of the cache of the encode dictionary 
+        so far, zeros if it is not cached
+        """
+        return (getattr(self.encode_dictionary, 'hits', 0), 
+                getattr(self.encode_dictionary, 'misses', 0))
+
+    def _checkpoints_enabled(self):
+        """
+        :return: bool: True if checkpoints are to be made
+        """
+        return (self.checkpoint_every is not None or 
+                self.checkpoint_interval is not None)
+
+    def _fingerprints_enabled(self):
+        """
+        :return: bool: True if the fingerprints of the documents are to be 
+        taken and saved, which is only needed to append to the public folder 
+        or to resume the hashing
+        """
+        return (bool(self.append) or self._checkpoints_enabled() or 
+                self._checkpoint is not None)
+
+    def _load_checkpoint(self):
+        """
+        :return: dict or None: the progress recorded by the last checkpoint 
+        of an interrupted hashing, if there is one
+        """
+        if not os.path.isfile(self.checkpoint_path):
+            logger.info('no checkpoint to resume from. hashing the corpus '
+                        'from the start.')
+            return None
+        with open(self.checkpoint_path, 'rt', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        logger.info('resuming the hashing to {} after document {}.'.format(
+                                            checkpoint['public_folder'], 
+                                            checkpoint['documents']))
+        return checkpoint
+
+    def _maybe_checkpoint(self, corpus_size, writer, ids_writer=None):
+        """
+        makes a checkpoint if checkpoint_every documents were hashed, or 
+        checkpoint_interval seconds passed, since the previous one.
+        :param corpus_size: int: number of documents in the public folder.
+        :param writer: writer of the output format.
+        :param ids_writer: writer of the integer ids, if any.
+        :return: None
+        """
+        if ((self.checkpoint_every is not None and 
+                corpus_size - self._checkpointed_size >= self.checkpoint_every) 
+                or (self.checkpoint_interval is not None and 
+                    time.monotonic() - self._checkpointed_at >= 
+                    self.checkpoint_interval)):
+            with self.stats.timer('writing'):
+                self._save_checkpoint(corpus_size, writer, ids_writer)
+
+    def _save_checkpoint(self, corpus_size, writer, ids_writer=None):
+        """
+        flushes the documents written so far, stores the new tokens of the 
+        en(de)coding dictionaries and then records the progress of the 
+        hashing in /private/checkpoint.json. an interruption at any point 
+        leaves the previous checkpoint usable.
+        :param corpus_size: int: number of documents in the public folder.
+        :param writer: writer of the output format.
+        :param ids_writer: writer of the integer ids, if any.
+        :return: None
+        """
+        writer.flush()
+        if ids_writer is not None:
+            ids_writer.flush()
+        if self.store_dictionaries:
+            self.dictionary_store.checkpoint()
+        # the checkpoint records the size of the fingerprints file, which must 
+        # be on disk first
+        self._save_fingerprints(sync=True)
+        checkpoint = {'public_folder': os.path.basename(self.public_path), 
+                      'documents': corpus_size, 
+                      'corpus_position': self._corpus_position, 
+                      'fingerprints_size': os.path.getsize(self.fingerprints_path), 
+                      'output_format': self.output_format, 
+                      'integer_ids': self.integer_ids}
+        write_atomically(self.checkpoint_path, json.dumps(checkpoint).encode())
+        self._checkpointed_size = corpus_size
+        self._checkpointed_at = time.monotonic()
+        logger.debug('checkpoint after document {}.'.format(corpus_size))
+
+    def _close_writers(self, *writers):
+        """
+        closes the writers, waiting for the documents queued to background 
+        writers to be written (and counting their bytes), and raises the first 
+        error any of them raised.
+        :param writers: writers of the output format or of integer ids (or 
+        None).
+        :return: None
+        """
+        error = None
+        for writer in writers:
+            if writer is None:
+                continue
+            try:
+                writer.close()
+            except Exception as close_error:
+                error = error or close_error
+            if isinstance(writer, BackgroundWriter):
+                self.stats.bytes_written += writer.bytes_written
+        if error is not None:
+            raise error
+
+    def _hash_corpus_serial(self, writer, ids_writer=None):
+        """
+        hashes the corpus in the current process, one document at a time: the 
+        document is flattened (see corpushash.formats.flatten_nested_list), its 
+        tokens not yet in the encode dictionary are hashed in bulk, then the 
+        hashed document is rebuilt from the hashed tokens, serialized and 
+        written.
+        :param writer: writer of the output format (see corpushash.formats).
+        :param ids_writer: IdsWriter: writer of the integer ids, if any.
+        :return: int: number of documents in the public folder
+        """
+        stats = self.stats
+        corpus_size = self.start_index
+        for ix, document in self._iter_new_documents():
+            with stats.timer('hashing'):
+                tokens, shape = flatten_nested_list(document)
+                document_dictionary = self._encode_tokens(tokens)
+                hashed_tokens = list(map(document_dictionary.__getitem__, tokens))
+            with stats.timer('serialization'):
+                serialized_document = _serialize_hashed_document(
+                                        hashed_tokens, shape, self.serializer, 
+                                        self._document_indent())
+            with stats.timer('writing'):
+                stats.bytes_written += writer.write(ix, serialized_document)
+                if ids_writer is not None:
+                    stats.bytes_written += self._write_ids(
+                                ids_writer, ix, tokens, shape, document_dictionary)
+            stats.tokens += len(tokens)
+            stats.add_documents()
+            corpus_size = ix + 1
+            self._fingerprints_written(corpus_size)
+            self._maybe_checkpoint(corpus_size, writer, ids_writer)
+        return corpus_size
+
+    def _document_indent(self):
+        """
+        :return: int or None: indentation of the hashed documents. packed 
+        documents must fit in a line, so they are never indented.
+        """
+        if self.output_format == 'jsonl':
+            return None
+        return self.indent_json
+
+    def _write_ids(self, ids_writer, ix, tokens, shape, document_dictionary):
+        """
+        stores a document as integer ids.
+        :param ids_writer: IdsWriter: writer of the integer ids.
+        :param ix: int: index of the document.
+        :param tokens: list: tokens of the document, in order.
+        :param shape: array: shape of the document.
+        :param document_dictionary: dict: maps the document's tokens to their 
+        hashes.
+        :return: int: number of bytes written
+        """
+        token_ids = {token: ids_writer.token_id(hashed_token) 
+                     for token, hashed_token in document_dictionary.items()}
+        return ids_writer.write(
+                ix, array.array('I', map(token_ids.__getitem__, tokens)), shape)
+
+    def _iter_new_documents(self):
+        """
+        iterates over the corpus, numbering its documents after the ones 
+        already in the public folder, and taking their fingerprints, which are 
+        only saved to /private once the documents are written (see 
+        _fingerprints_written and _save_fingerprints). if self.append is set, 
+        documents whose fingerprint was already saved for the public folder 
+        are skipped. when resuming, the documents of the corpus taken before 
+        the checkpoint are skipped.
+        :yield: int, list: index of the document, document
+        """
+        fingerprints = set()
+        fingerprints_enabled = self._fingerprints_enabled()
+        if fingerprints_enabled:
+            os.makedirs(os.path.dirname(self.fingerprints_path), exist_ok=True)
+        corpus = self.corpus
+        self._corpus_position = 0
+        if self._checkpoint is not None:
+            # forget the fingerprints of the documents saved after it
+            # (never past its end, which would pad it with NUL bytes)
+            with open(self.fingerprints_path, 'ab') as f:
+                f.truncate(min(f.tell(), self._checkpoint['fingerprints_size']))
+            self._corpus_position = self._checkpoint['corpus_position']
+            corpus = itertools.islice(corpus, self._corpus_position, None)
+        if self.append and os.path.isfile(self.fingerprints_path):
+            with open(self.fingerprints_path, 'rt', encoding='ascii') as f:
+                fingerprints.update(line.rstrip('\n') for line in f)
+        elif self.append and self.start_index:
+            logger.warning('no fingerprints found for {}, documents already '
+                           'hashed to it will not be skipped.'.format(
+                                                            self.public_path))
+        ix = self.start_index
+        for document in corpus:
+            self._corpus_position += 1
+            if not fingerprints_enabled:
+                yield ix, document
+                ix += 1
+                continue
+            fingerprint = document_fingerprint(document)
+            if self.append:
+                if fingerprint in fingerprints:
+                    continue
+                fingerprints.add(fingerprint)
+            self._taken_fingerprints.append((ix, fingerprint))
+            yield ix, document
+            ix += 1
+
+    def _fingerprints_written(self, corpus_size):
+        """
+        marks the fingerprints of the documents up to corpus_size as written, 
+        to be saved along with the dictionaries.
+        :param corpus_size: int: number of documents written to the public 
+        folder.
+        :return: None
+        """
+        taken = self._taken_fingerprints
+        written = 0
+        while written < len(taken) and taken[written][0] < corpus_size:
+            written += 1
+        self._written_fingerprints.extend(fingerprint for _, fingerprint 
+                                          in taken[:written])
+        del taken[:written]
+
+    def _save_fingerprints(self, sync=False):
+        """
+        appends the fingerprints of the documents written since they were last 
+        saved to /private/fingerprints. this is done when the dictionaries are 
+        stored, so that a later append only skips documents that were both 
+        written and can be decoded.
+        :param sync: bool: if True, the file is synced to disk.
+        :return: None
+        """
+        if not self._fingerprints_enabled():
+            return
+        with open(self.fingerprints_path, 'at', 
+                  encoding='ascii') as fingerprints_file:
+            fingerprints_file.writelines(fingerprint + '\n' for fingerprint 
+                                         in self._written_fingerprints)
+            if sync:
+                fingerprints_file.flush()
+                os.fsync(fingerprints_file.fileno())
+        self._written_fingerprints = []
+
+    def _hash_corpus_parallel(self, writer, ids_writer=None):
+        """
+        hashes the corpus using a pool of self.workers processes. the corpus is 
+        consumed in batches of chunks of self.chunk_size documents, so that only 
+        a batch of documents is kept in memory at a time.
+        :param writer: writer of the output format (see corpushash.formats).
+        :param ids_writer: IdsWriter: writer of the integer ids, if any.
+        :return: int: number of documents in the public folder
+        """
+        corpus_size = self.start_index
+        chunks = _iter_chunks(self._iter_new_documents(), self.chunk_size)
+        with multiprocessing.Pool(self.workers) as pool:
+            for batch in _iter_chunks(chunks, 2 * self.workers):
+                self._hash_batch_parallel(pool, batch, writer, ids_writer)
+                batch_size = sum(len(chunk) for chunk in batch)
+                corpus_size += batch_size
+                self.stats.add_documents(batch_size)
+                self._fingerprints_written(corpus_size)
+                self._maybe_checkpoint(corpus_size, writer, ids_writer)
         return corpus_size
 
-    def _hash_document(self, input_document, output_document):
+    def _hash_batch_parallel(self, pool, batch, writer, ids_writer=None):
+        """
+        first the documents of the batch are flattened (see 
+        corpushash.formats.flatten_nested_list), which is also the form they 
+        are sent to the workers in, and the tokens of their vocabulary not yet 
+        in the encode dictionary are hashed in parallel chunks. the results are 
+        merged into the en(de)coding dictionaries in this process, so collisions 
+        are handled as in the serial path. then the hashed documents are 
+        serialized in parallel, each worker receiving only the part of the 
+        encode dictionary (and of the integer ids) its documents need. workers 
+        write .json files themselves; packed documents and integer ids are 
+        sent back to be written in order.
+        :param pool: multiprocessing.Pool: pool of worker processes.
+        :param batch: list: chunks (lists) of (index, document) tuples.
+        :param writer: writer of the output format (see corpushash.formats).
+        :param ids_writer: IdsWriter: writer of the integer ids, if any.
+        :return: None
+        """
+        stats = self.stats
+        hashing_started_at = time.perf_counter()
+        flat_batch, chunk_vocabularies = [], []
+        for chunk in batch:
+            flat_chunk, vocabulary = [], set()
+            for ix, document in chunk:
+                tokens, shape = flatten_nested_list(document)
+                stats.tokens += len(tokens)
+                vocabulary.update(tokens)
+                flat_chunk.append((ix, tokens, shape))
+            flat_batch.append(flat_chunk)
+            chunk_vocabularies.append(vocabulary)
+        batch_vocabulary = set().union(*chunk_vocabularies)
+        # one lookup per token (not set.difference, which would iterate over 
+        # a dictionary on disk), whose hash is kept for the chunk dictionaries
+        encode_dictionary = self.encode_dictionary
+        batch_dictionary, new_tokens = {}, []
+        for token in batch_vocabulary:
+            try:
+                batch_dictionary[token] = encode_dictionary[token]
+            except KeyError:
+                new_tokens.append(token)
+        stats.cached_tokens += len(batch_dictionary)
+        stats.new_tokens += len(new_tokens)
+        token_chunk_size = max(1, -(-len(new_tokens) // (self.workers * 4)))
+        hash_tasks = [(new_tokens[i:i + token_chunk_size], self.hash_function, 
+                       self.salt_length, self.one_salt, self.key) 
+                      for i in range(0, len(new_tokens), token_chunk_size)]
+        for hashed_chunk in pool.imap_unordered(_hash_token_chunk, hash_tasks):
+            for token, hashed_token, salt in hashed_chunk:
+                if self.store_dictionaries:
+                    hashed_token = self._register_token(token, hashed_token, 
+                                                        salt)
+                batch_dictionary[token] = hashed_token
+        stats.add_time('hashing', time.perf_counter() - hashing_started_at)
+        serialization_started_at = time.perf_counter()
+        in_workers = self.output_format == 'json'
+        export_tasks = []
+        for flat_chunk, chunk_vocabulary in zip(flat_batch, chunk_vocabularies):
+            chunk_dictionary = {token: batch_dictionary[token] 
+                                for token in chunk_vocabulary}
+            chunk_ids = None
+            if ids_writer is not None:
+                # ids are given in order of appearance in the documents, as 
+                # in the serial path
+                chunk_ids = {token: ids_writer.token_id(chunk_dictionary[token]) 
+                             for token in dict.fromkeys(itertools.chain.from_iterable(
+                                        tokens for _, tokens, _ in flat_chunk))}
+            export_tasks.append((flat_chunk, chunk_dictionary, chunk_ids, 
+                                 self._document_indent(), 
+                                 self.public_path if in_workers else None, 
+                                 self.serializer))
+        if in_workers and ids_writer is None:
+            imap = pool.imap_unordered
+        else:
+            imap = pool.imap
+        writing_time = 0.
+        for exported_chunk in imap(_export_document_chunk, export_tasks):
+            writing_started_at = time.perf_counter()
+            for (ix, serialized_document, token_ids, shape, 
+                                            bytes_written) in exported_chunk:
+                if serialized_document is not None:
+                    bytes_written += writer.write(ix, serialized_document)
+                if token_ids is not None:
+                    bytes_written += ids_writer.write(ix, token_ids, shape)
+                stats.bytes_written += bytes_written
+            writing_time += time.perf_counter() - writing_started_at
+        # documents written as .json files by the workers count as serialized
+        stats.add_time('serialization', time.perf_counter() - 
+                                        serialization_started_at - writing_time)
+        stats.add_time('writing', writing_time)
+
+    def _hash_document(self, input_document):
         """
-        iterates over input_document, hashes its elements, and substitutes them 
-        into output_document (its former copy).
+        builds a new nested list with the structure of input_document, whose 
+        tokens are hashed. the document is walked only once, and iteratively, 
+        so that deeply nested documents do not hit the recursion limit.
         :param input_document: list: nested list of tokens (nested list of str).
-        :param output_document: list: nested list of tokens (nested list of 
-        str), a deep copy of input document.
         :return: list: nested list of hashed tokens
         """
-        for ix, item in enumerate(input_document):
-            if isinstance(item, str):
-                output_document[ix] = self._encode_token(item)
-            else:
-                output_document[ix] = self._hash_document(item, 
-                                                            output_document[ix])
-        return output_document
+        return _map_nested_list(input_document, self._encode_token)
 
     def _encode_token(self, token):
         """
@@ -182,21 +807,80 @@ class CorpusHash:
         :param token: str: token.
         :return: str: hashed token
         """
-        if token in self.encode_dictionary:
+        try:
+            # a single lookup, which matters for dictionaries on disk
             return self.encode_dictionary[token]
-        else:
+        except KeyError:
+            hashed_token, salt = self._hash_new_tokens([token])[0]
+            return self._register_token(token, hashed_token, salt)
+
+    def _hash_new_tokens(self, tokens):
+        """
+        hashes tokens according to class arguments, with a key or with salts.
+        :param tokens: list: tokens (str).
+        :return: list: (hashed token, salt) tuples, salt being None if hashing 
+        with a key
+        """
+        if self.key is not None:
+            return [(hashed_token, None) for hashed_token 
+                    in keyed_hash_tokens(tokens, self.key, self.hash_function)]
+        return hash_tokens(tokens, hash_function=self.hash_function, 
+                           salt_length=self.salt_length, salt=self.one_salt)
+
+    def _encode_tokens(self, tokens):
+        """
+        batch version of _encode_token: hashes the tokens not yet in the 
+        encode dictionary with a single call to hash_tokens (or 
+        keyed_hash_tokens) and adds them to the en(de)coding dictionaries, 
+        unless they are not stored.
+        :param tokens: iterable: tokens (str), possibly repeated.
+        :return: dict: maps each (distinct) token to its hash
+        """
+        encode_dictionary = self.encode_dictionary
+        hashes, new_tokens = {}, []
+        for token in dict.fromkeys(tokens):
+            try:
+                hashes[token] = encode_dictionary[token]
+            except KeyError:
+                new_tokens.append(token)
+        self.stats.cached_tokens += len(hashes)
+        self.stats.new_tokens += len(new_tokens)
+        hashed_tokens = self._hash_new_tokens(new_tokens)
+        for token, (hashed_token, salt) in zip(new_tokens, hashed_tokens):
+            if self.store_dictionaries:
+                hashed_token = self._register_token(token, hashed_token, salt)
+            hashes[token] = hashed_token
+        return hashes
+
+    def _register_token(self, token, hashed_token, salt):
+        """
+        adds a newly hashed token to the en(de)coding dictionaries. if its hash 
+        collides with one already in the decode dictionary (overkill), the 
+        token is hashed again with a new random salt until it doesn't. a 
+        collision of keyed hashes can't be solved, so it raises an exception.
+        :param token: str: token.
+        :param hashed_token: str: hashed token.
+        :param salt: bytes or None: salt used to hash the token, None if it was 
+        hashed with a key.
+        :return: str: hashed token, as stored in the dictionaries
+        """
+        if salt is None:
+            if hashed_token in self.decode_dictionary:
+                raise ValueError('keyed hash of {!r} collides with the one of '
+                                 '{!r}.'.format(token, 
+                                    self.decode_dictionary[hashed_token][0]))
+            self.decode_dictionary[hashed_token] = (token, None)
+            self.encode_dictionary[token] = hashed_token
+            return hashed_token
+        while hashed_token in self.decode_dictionary:
+            self.stats.collisions += 1
             hashed_token, salt = hash_token(token, 
-                                            hash_function=self.hash_function, 
+                                            hash_function=self.hash_function,
                                             salt_length=self.salt_length,
-                                            salt=self.one_salt)
-            while hashed_token in self.decode_dictionary:
-                hashed_token, salt = hash_token(token, 
-                                               hash_function=self.hash_function,
-                                               salt_length=self.salt_length,
-                                               salt=None)
-            self.decode_dictionary[hashed_token] = (token, 
-                                                    base64.b85encode(salt).decode())
-            self.encode_dictionary[token] = hashed_token
+                                            salt=None)
+        self.decode_dictionary[hashed_token] = (token, 
+                                                base64.b85encode(salt).decode())
+        self.encode_dictionary[token] = hashed_token
         return hashed_token
 
     def _export_work(self, var_to_dump, file_path):
@@ -208,22 +892,161 @@ class CorpusHash:
         contain filename and extension.
         :return: None; but files (dictionaries and documents) are created.
         """
-        with open(file_path, mode='wt', encoding=self.encoding) as output:
-            json.dump(var_to_dump, output, indent=self.indent_json, 
-                      ensure_ascii=False)
+        _export_json(var_to_dump, file_path, self.serializer, self.indent_json)
 
     def read_hashed_corpus(self):
         """
-        reads hashed corpus one document at a time, in order. it uses the fact 
-        that files are numbered from 0 to n to sort files.
-        :yield: str, list: document name, hashed document as a nested list
+        reads hashed corpus one document at a time, in order, whatever its 
+        output format.
+        :yield: list: hashed document as a nested list
+        """
+        reader = open_reader(self.public_path, encoding=self.encoding, 
+                             serializer=self.serializer)
+        try:
+            yield from reader
+        finally:
+            reader.close()
+
+    def decode_document(self, hashed_document):
+        """
+        restores the tokens of a hashed document (or of any nested list of 
+        hashed tokens, such as NLP results), keeping its structure. the lookup 
+        of tokens by their hashes is built from the decode dictionary the first 
+        time it is needed, and reused afterwards.
+        :param hashed_document: list or str: nested list of hashed tokens, or a 
+        single hashed token.
+        :return: list or str: nested list of tokens, or a single token
+        """
+        decode_lookup = self._get_decode_lookup()
+        if isinstance(hashed_document, str):
+            return decode_lookup[hashed_document]
+        return _map_nested_list(hashed_document, decode_lookup.__getitem__)
+
+    def decode_corpus(self, shard=0, num_shards=1, workers=None):
+        """
+        reads the hashed corpus from /public and restores its documents one at 
+        a time, in order. the corpus may be split in shards (document ix 
+        belongs to shard ix % num_shards), so that separate processes or 
+        machines can each decode a shard, and a shard may be decoded by a pool 
+        of worker processes.
+        :param shard: int: the shard to be decoded, from 0 to num_shards - 1.
+        :param num_shards: int: number of shards the corpus is split into.
+        :param workers: int: number of processes used to decode the shard. if 
+        None or 1, it is decoded in the current process. at most 2 * workers 
+        chunks of chunk_size documents are decoded ahead of the ones yielded.
+        :yield: list: the next decoded document as a nested list
+        """
+        if not 0 <= shard < num_shards:
+            raise ValueError('shard must be between 0 and num_shards - 1.')
+        decode_lookup = self._get_decode_lookup()
+        reader = open_reader(self.public_path, encoding=self.encoding, 
+                             serializer=self.serializer)
+        try:
+            if workers is not None and workers > 1:
+                chunks = _iter_chunks(range(shard, len(reader), num_shards), 
+                                      self.chunk_size)
+                with multiprocessing.Pool(workers, initializer=_init_decoder, 
+                                          initargs=(decode_lookup, 
+                                                    self.public_path, 
+                                                    self.encoding, 
+                                                    self.serializer)) as pool:
+                    # only a few chunks are decoded ahead of the consumer
+                    for decoded_chunk in _imap_bounded(
+                                pool, _decode_document_chunk, chunks, 
+                                2 * workers):
+                        yield from decoded_chunk
+            elif num_shards == 1:
+                for hashed_document in reader:
+                    yield _map_nested_list(hashed_document, 
+                                           decode_lookup.__getitem__)
+            else:
+                for ix in range(shard, len(reader), num_shards):
+                    yield _map_nested_list(reader[ix], decode_lookup.__getitem__)
+        finally:
+            reader.close()
+
+    def _get_decode_lookup(self):
+        """
+        builds (once) a dict mapping each hashed token to its token, from the 
+        decode dictionary, in which tokens are stored along with their salts.
+        :return: dict: decode lookup
+        """
+        if self._decode_lookup is None:
+            if hasattr(self.decode_dictionary, 'iter_items'):
+                items = self.decode_dictionary.iter_items()
+            else:
+                items = self.decode_dictionary.items()
+            self._decode_lookup = {hashed_token: token_and_salt[0] 
+                                   for hashed_token, token_and_salt in items}
+        return self._decode_lookup
+
+    def read_id_corpus(self, nested=False):
+        """
+        reads the corpus stored as integer ids (see integer_ids) one document 
+        at a time, in order. the hashed token of each id is given by 
+        read_id_vocabulary.
+        :param nested: bool: if True, documents are rebuilt as nested lists of 
+        ids; else they are given in their flat representation (see 
+        corpushash.formats.flatten_nested_list).
+        :yield: list or (array, array): nested list of ids, or token ids and 
+        shape of the document
+        """
+        for token_ids, shape in IdsReader(self.public_path):
+            if nested:
+                yield unflatten_nested_list(token_ids, shape)
+            else:
+                yield token_ids, shape
+
+    def read_id_vocabulary(self):
+        """
+        :return: list: hashed tokens, indexed by their integer ids
+        """
+        return IdsReader(self.public_path).vocabulary()
+
+    def read_hashed_document(self, ix):
+        """
+        reads a single hashed document. in the 'jsonl' output format, the 
+        document is read directly from a memory map of the packed corpus.
+        :param ix: int: index of the document.
+        :return: list: hashed document as a nested list
+        """
+        return self._get_reader()[ix]
+
+    def _get_reader(self):
+        """
+        opens (once) a reader of the hashed corpus, kept open so that reading 
+        documents one at a time does not load the index at every call. it is 
+        closed when the corpus is hashed again.
+        :return: reader of the output format of the public folder
+        """
+        if self._reader is None:
+            self._reader = open_reader(self.public_path, encoding=self.encoding, 
+                                       serializer=self.serializer)
+        return self._reader
+
+    def _close_reader(self):
+        """
+        closes the reader opened by _get_reader, if any.
+        :return: None
         """
-        for ix in range(self.corpus_size):
-            with open(os.path.join(self.public_path, '{}.json'.format(ix)), 
-                      mode='rt', encoding=self.encoding) as hashed_document:
-                hashed_document_list = json.load(fp=hashed_document, 
-                                                 encoding=self.encoding)
-            yield hashed_document_list
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+
+def log_progress(stats):
+    """
+    callback for HashingStats (see corpushash.instrumentation) that logs the 
+    progress of the hashing.
+    :param stats: HashingStats: the stats of the hashing.
+    :return: None
+    """
+    elapsed = stats.elapsed_time()
+    logger.info('{} documents ({} tokens, {} new) hashed in {:.1f} s: {:.0f} '
+                'tokens/s, {:.1f} MB written.'.format(
+                    stats.documents, stats.tokens, stats.new_tokens, elapsed, 
+                    stats.tokens / elapsed if elapsed else 0., 
+                    stats.bytes_written / 1e6))
 
 
 def hash_token(token, hash_function='sha256', salt_length=32, salt=None):
@@ -246,40 +1069,328 @@ def hash_token(token, hash_function='sha256', salt_length=32, salt=None):
     return hashed_token, salt
 
 
+def document_fingerprint(document):
+    """
+    computes a fingerprint of a document's content, used to recognize 
+    documents already hashed when appending to a hashed corpus. as it is an 
+    unsalted hash of the plaintext, it must be kept private.
+    :param document: list: nested list of str.
+    :return: str: hexadecimal fingerprint
+    """
+    # serialized with the json module whatever the serializer, so that the 
+    # fingerprints of a document don't depend on it
+    try:
+        serialized_document = json.dumps(document, ensure_ascii=False)
+    except RecursionError:
+        # same output, serialized iteratively
+        serialized_document = ''.join(iter_hashed_json(
+                document, lambda token: json.dumps(token, ensure_ascii=False)[1:-1]))
+    return hashlib.blake2b(serialized_document.encode(), 
+                           digest_size=20).hexdigest()
+
+
+def hash_tokens(tokens, hash_function='sha256', salt_length=32, salt=None):
+    """
+    batch version of hash_token: hashes each token along with a random salt of 
+    given length. all salts are drawn with a single os.urandom call, the 
+    hasher is created once and copied for each token, and the digests are 
+    base85-encoded in bulk. the results are the same as those of hash_token.
+    :param tokens: iterable: tokens (str) to be hashed.
+    :param hash_function: str: hash function to use (check hashlib library).
+    :param salt_length: int: salt length in bytes.
+    :param salt: bytes: if given, this salt is used for every token instead of 
+    a random one.
+    :return: list: (hashed token, salt) tuples, in the order of tokens.
+    """
+    tokens = list(tokens)
+    if salt is None:
+        salt_buffer = memoryview(os.urandom(salt_length * len(tokens)))
+        salts = [salt_buffer[ix * salt_length:(ix + 1) * salt_length].tobytes() 
+                 for ix in range(len(tokens))]
+    else:
+        salts = [salt] * len(tokens)
+    base_hasher = hashlib.new(hash_function)
+    digests = []
+    for token, token_salt in zip(tokens, salts):
+        token_hasher = base_hasher.copy()
+        token_hasher.update(token.encode())
+        token_hasher.update(token_salt)
+        digests.append(token_hasher.digest())
+    hashed_tokens = _b85encode_digests(digests, base_hasher.digest_size)
+    return list(zip(hashed_tokens, salts))
+
+
+def keyed_hash_token(token, key, hash_function='sha256'):
+    """
+    hashes a token with a secret key instead of a salt: the same token and key 
+    always give the same hash, so no salt needs to be stored.
+    :param token: str: string of any length
+    :param key: bytes: secret key.
+    :param hash_function: str: hash function to use (check hashlib library). 
+    blake2b and blake2s are used in their keyed mode, others through HMAC.
+    :return: str: hashed token (base85-decoded)
+    """
+    return keyed_hash_tokens([token], key, hash_function)[0]
+
+
+def keyed_hash_tokens(tokens, key, hash_function='sha256'):
+    """
+    batch version of keyed_hash_token: the keyed hasher is prepared once and 
+    copied for each token, and the digests are base85-encoded in bulk.
+    :param tokens: iterable: tokens (str) to be hashed.
+    :param key: bytes: secret key.
+    :param hash_function: str: hash function to use (check hashlib library).
+    :return: list: hashed tokens, in the order of tokens.
+    """
+    if hash_function in ('blake2b', 'blake2s'):
+        base_hasher = getattr(hashlib, hash_function)(key=key)
+    else:
+        base_hasher = hmac.new(key, digestmod=hash_function)
+    digests = []
+    for token in tokens:
+        token_hasher = base_hasher.copy()
+        token_hasher.update(token.encode())
+        digests.append(token_hasher.digest())
+    return _b85encode_digests(digests, base_hasher.digest_size)
+
+
+def _b85encode_digests(digests, digest_size):
+    """
+    base85-encodes a list of digests of the same size.
+    :param digests: list: digests (bytes).
+    :param digest_size: int: size of each digest in bytes.
+    :return: list: encoded digests (str)
+    """
+    if digest_size % 4 == 0:
+        # base85 encodes groups of 4 bytes, so the encoding of the 
+        # concatenated digests is the concatenation of their encodings.
+        encoded_length = digest_size // 4 * 5
+        encoded_digests = base64.b85encode(b''.join(digests)).decode()
+        return [encoded_digests[start:start + encoded_length] 
+                for start in range(0, len(encoded_digests), encoded_length)]
+    return [base64.b85encode(digest).decode() for digest in digests]
+
+
+def read_json_documents(file_paths, encoding='utf-8', serializer='auto'):
+    """
+    lazily reads a corpus stored as one .json file per document, to be passed 
+    as corpus to CorpusHash without loading the whole corpus into memory.
+    :param file_paths: iterable: paths of the .json files, one per document, in 
+    the order they are to be hashed.
+    :param encoding: str: encoding of the files.
+    :param serializer: str: JSON library parsing the files (see 
+    corpushash.serializers.get_serializer).
+    :yield: list: the next document as a nested list of str
+    """
+    loads = get_serializer(serializer, encoding).loads
+    for file_path in file_paths:
+        with open(file_path, mode='rb') as document_file:
+            yield loads(document_file.read())
+
+
+def read_jsonl_corpus(file_path, encoding='utf-8', serializer='auto'):
+    """
+    lazily reads a corpus stored as a JSON-lines file, each line being a 
+    document as a nested list of str, to be passed as corpus to CorpusHash 
+    without loading the whole corpus into memory. blank lines are skipped.
+    :param file_path: str: path of the .jsonl file.
+    :param encoding: str: encoding of the file.
+    :param serializer: str: JSON library parsing the lines (see 
+    corpushash.serializers.get_serializer).
+    :yield: list: the next document as a nested list of str
+    """
+    loads = get_serializer(serializer, encoding).loads
+    with open(file_path, mode='rt', encoding=encoding) as corpus_file:
+        for line in corpus_file:
+            if line.strip():
+                yield loads(line)
+
+
+def _iter_chunks(iterable, size):
+    """
+    groups the items of an iterable into lists of (at most) size items, 
+    consuming the iterable lazily.
+    :param iterable: iterable: items to be grouped.
+    :param size: int: number of items per chunk.
+    :yield: list: the next chunk
+    """
+    iterator = iter(iterable)
+    chunk = list(itertools.islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(iterator, size))
+
+
+def _hash_token_chunk(args):
+    """
+    hashes a chunk of tokens in a worker process.
+    :param args: tuple: list of tokens, hash function, salt length, salt 
+    (None for a random salt per token), as taken by hash_tokens, and key 
+    (None to hash with salts), as taken by keyed_hash_tokens.
+    :return: list: (token, hashed token, salt) tuples, salt being None if 
+    hashing with a key
+    """
+    tokens, hash_function, salt_length, salt, key = args
+    if key is not None:
+        return [(token, hashed_token, None) for token, hashed_token 
+                in zip(tokens, keyed_hash_tokens(tokens, key, hash_function))]
+    hashed_tokens = hash_tokens(tokens, hash_function=hash_function, 
+                                salt_length=salt_length, salt=salt)
+    return [(token, hashed_token, token_salt) 
+            for token, (hashed_token, token_salt) in zip(tokens, hashed_tokens)]
+
+
+def _export_document_chunk(args):
+    """
+    hashes a chunk of documents in a worker process using a precomputed 
+    encode dictionary. if a public path is given, each document is written 
+    to its .json file; else the serialized documents are returned. if integer 
+    ids are given, the documents are also returned as arrays of ids.
+    :param args: tuple: list of (index, tokens, shape) tuples, the flat 
+    representation of the documents, encode dictionary covering their tokens, 
+    integer ids of these tokens (or None), indent_json, public path (or None) 
+    and serializer.
+    :return: list: (index, serialized document or None, token ids or None, 
+    shape or None, number of bytes written by the worker) tuples
+    """
+    (documents, encode_dictionary, token_ids, indent_json, public_path, 
+                                                            serializer) = args
+    encode = encode_dictionary.__getitem__
+    writer = None
+    if public_path is not None:
+        writer = WRITERS['json'](public_path, encoding=serializer.encoding)
+    exported_chunk = []
+    for ix, tokens, shape in documents:
+        serialized_document = _serialize_hashed_document(
+                                list(map(encode, tokens)), shape, serializer, 
+                                indent_json)
+        document_ids = None
+        bytes_written = 0
+        if writer is not None:
+            bytes_written = writer.write(ix, serialized_document)
+            serialized_document = None
+        if token_ids is not None:
+            document_ids = array.array('I', map(token_ids.__getitem__, tokens))
+        exported_chunk.append((ix, serialized_document, document_ids, 
+                               shape if token_ids is not None else None, 
+                               bytes_written))
+    return exported_chunk
+
+
+_decoder = {}
+
+
+def _init_decoder(decode_lookup, public_path, encoding, serializer):
+    """
+    initializes a worker process decoding documents, keeping its decode 
+    lookup and a reader of the hashed corpus.
+    """
+    _decoder['decode'] = decode_lookup.__getitem__
+    _decoder['reader'] = open_reader(public_path, encoding=encoding, 
+                                     serializer=serializer)
+
+
+def _decode_document_chunk(document_indices):
+    """
+    reads and decodes a chunk of hashed documents in a worker process.
+    :param document_indices: list: indices of the documents.
+    :return: list: decoded documents
+    """
+    reader = _decoder['reader']
+    return [_map_nested_list(reader[ix], _decoder['decode']) 
+            for ix in document_indices]
+
+
+def _map_nested_list(input_document, function):
+    """
+    builds a new nested list with the same structure as input_document, 
+    replacing each string by function(string). uses an explicit stack instead 
+    of recursion, so any nesting depth is supported.
+    :param input_document: list: a nested list of strings
+    :param function: callable: takes a string and returns its substitute
+    :return: list: the mapped nested list
+    """
+    output_document = []
+    stack = [(iter(input_document), output_document)]
+    while stack:
+        items, output_list = stack[-1]
+        for item in items:
+            if isinstance(item, str):
+                output_list.append(function(item))
+            else:
+                output_sublist = []
+                output_list.append(output_sublist)
+                stack.append((iter(item), output_sublist))
+                break
+        else:
+            stack.pop()
+    return output_document
+
+
+def _serialize_hashed_document(hashed_tokens, shape, serializer, 
+                               indent_json=None):
+    """
+    rebuilds a hashed document from its flat representation and serializes 
+    it. documents nested too deep for the serializer are serialized 
+    iteratively by iter_hashed_json.
+    :param hashed_tokens: list: hashed tokens of the document, in order.
+    :param shape: array: shape of the document (see 
+    corpushash.formats.flatten_nested_list).
+    :param serializer: JSONSerializer: serializer of the hashed document.
+    :param indent_json: int or None: indentation, as in json.dump.
+    :return: bytes: the hashed document as encoded JSON text
+    """
+    hashed_document = unflatten_nested_list(hashed_tokens, shape)
+    try:
+        return serializer.dumps(hashed_document, indent_json)
+    except serializer.nesting_errors:
+        # the tokens are already hashed
+        return ''.join(iter_hashed_json(hashed_document, str, indent_json)
+                       ).encode(serializer.encoding)
+
+
+def _export_json(var_to_dump, file_path, serializer, indent_json):
+    """
+    dumps a Python object to a .json file.
+    :param var_to_dump: dictionary or nested list of str.
+    :param file_path: file path where var_to_dump is to be written.
+    :param serializer: JSONSerializer: serializer of var_to_dump, which also 
+    sets the encoding of the outputted file.
+    :param indent_json: int or None: indentation, as in json.dump.
+    :return: None
+    """
+    with open(file_path, mode='wb') as output:
+        output.write(serializer.dumps(var_to_dump, indent_json))
+
+
 def walk_nested_list(input_document):
     """
-    takes a nested list of strings and yields its elements in order.
+    takes a nested list of strings and yields its elements in order. uses an 
+    explicit stack instead of recursion, so any nesting depth is supported.
     :param input_document: list: a nested list of strings
     :yield: str: the next string
     """
-    for item in input_document:
-        if isinstance(item, str):
-            yield item
+    stack = [iter(input_document)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, str):
+                yield item
+            else:
+                stack.append(iter(item))
+                break
         else:
-            for subitem in walk_nested_list(item):
-                yield subitem
+            stack.pop()
 
 
 def text_split(text, stripchars=' .()[]{:},"\';'):
     """
     splits a text into a nested list along the strip characters provided. this 
     function is meant for tests. if you need a tokenizer, you should probably 
-    use a less naive one.
+    use a less naive one. to split large text files without reading them 
+    whole, see corpushash.tokenizers.iter_text_documents.
     :param text: str: text to be split.
     :param stripchars: str: characters to be used as splitting points.
     :return: str: text splitted at specified stripchars
     """
-    split_text = []
-    for line in text.splitlines():
-        sentences = []
-        for sentence in line.split('.'):
-            words = []
-            for word in sentence.split():
-                stripped_word = word.strip(stripchars)
-                if stripped_word:  # make sure we are adding something
-                    words.append(stripped_word)
-            if words:
-                sentences.append(words)
-        if sentences:
-            split_text.append(sentences)
-    return split_text
+    return [sentences for sentences in 
+            tokenize_lines(text.splitlines(), stripchars) if sentences]
@@ -0,0 +1,174 @@
+u"""
+counters, timings and profiling hooks for the hashing of a corpus.
+
+a HashingStats object is given to (or created by) CorpusHash, which updates it
+as documents are hashed. it may call back a function with its progress, and
+may profile the hashing with cProfile and trace its memory with tracemalloc.
+"""
+
+import time
+import pstats
+import cProfile
+import tracemalloc
+import contextlib
+
+
+class HashingStats:
+    """
+    counts the documents, tokens and bytes processed while hashing a corpus,
+    and the time spent in each of its phases: hashing the tokens
+    (hashing_time), serializing the hashed documents (serialization_time) and
+    writing them to disk (writing_time). when hashing with worker processes,
+    times are the wall-clock time each phase takes in the main process, and
+    when writing with background threads, writing_time is the time hashing
+    waits for them.
+       counters accumulate, so the same object may be given to several
+    hashings (e.g. appends) to get their totals.
+    """
+    COUNTERS = ('documents', 'tokens', 'new_tokens', 'cached_tokens',
+                'collisions', 'bytes_written', 'cache_hits', 'cache_misses')
+    TIMES = ('hashing_time', 'serialization_time', 'writing_time', 'elapsed')
+
+    def __init__(self, callback=None, report_every=1000, profile=False,
+                 trace_memory=False):
+        """
+        :param callback: callable: called with this object every report_every
+        documents, and when hashing ends. corpushash.hashers.log_progress
+        may be used.
+        :param report_every: int: number of documents between calls to
+        callback.
+        :param profile: bool: if True, the hashing is profiled with cProfile
+        (see profile_stats). only the main process is profiled.
+        :param trace_memory: bool: if True, memory allocations are traced with
+        tracemalloc during the hashing, and their peak is kept in peak_memory.
+        """
+        self.callback = callback
+        self.report_every = report_every
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.documents = 0  # documents hashed
+        self.tokens = 0  # tokens in these documents
+        self.new_tokens = 0  # distinct tokens hashed for the first time
+        # distinct tokens of a document (of a batch of documents, with worker
+        # processes) found in the encode dictionary
+        self.cached_tokens = 0
+        self.collisions = 0  # hashes rehashed because they collided
+        self.bytes_written = 0  # bytes of hashed documents (and integer ids)
+        # lookups of the encode dictionary served by its in-memory cache (or
+        # not), when it is kept on disk (see dictionary_cache_memory in CorpusHash)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.hashing_time = 0.
+        self.serialization_time = 0.
+        self.writing_time = 0.
+        self.elapsed = 0.
+        self.peak_memory = None
+        self.profiler = None
+        self._started_at = None
+        self._next_report = report_every
+        self._traces_memory = False
+
+    def start(self):
+        """
+        starts timing the hashing, and profiling and tracing memory if asked
+        to.
+        :return: None
+        """
+        if self.profile:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._traces_memory = True
+        self._started_at = time.perf_counter()
+
+    def stop(self):
+        """
+        stops timing, profiling and tracing memory, and calls the callback a
+        last time.
+        :return: None
+        """
+        if self._started_at is None:
+            return
+        self.elapsed += time.perf_counter() - self._started_at
+        self._started_at = None
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak_memory = max(peak, self.peak_memory or 0)
+            if self._traces_memory:
+                tracemalloc.stop()
+                self._traces_memory = False
+        if self.callback is not None:
+            self.callback(self)
+
+    def add_documents(self, count=1):
+        """
+        counts hashed documents, calling the callback every report_every
+        documents.
+        :param count: int: number of documents hashed.
+        :return: None
+        """
+        self.documents += count
+        if self.callback is not None and self.documents >= self._next_report:
+            while self._next_report <= self.documents:
+                self._next_report += self.report_every
+            self.callback(self)
+
+    @contextlib.contextmanager
+    def timer(self, phase):
+        """
+        adds the time spent in a with block to a phase.
+        :param phase: str: 'hashing', 'serialization' or 'writing'.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def add_time(self, phase, seconds):
+        """
+        :param phase: str: 'hashing', 'serialization' or 'writing'.
+        :param seconds: float: time spent in the phase.
+        :return: None
+        """
+        attribute = '{}_time'.format(phase)
+        setattr(self, attribute, getattr(self, attribute) + seconds)
+
+    def elapsed_time(self):
+        """
+        :return: float: seconds spent hashing so far, including the current
+        hashing
+        """
+        if self._started_at is None:
+            return self.elapsed
+        return self.elapsed + time.perf_counter() - self._started_at
+
+    def as_dict(self):
+        """
+        :return: dict: counters, times (in seconds, elapsed being up to date)
+        and peak memory (in bytes, or None)
+        """
+        stats = {name: getattr(self, name) for name in self.COUNTERS + self.TIMES}
+        stats['elapsed'] = self.elapsed_time()
+        stats['peak_memory'] = self.peak_memory
+        return stats
+
+    def profile_stats(self, sort='cumulative'):
+        """
+        :param sort: str: sort key of the statistics, as in pstats.
+        :return: pstats.Stats: profiling statistics of the hashing, if profile
+        was set
+        """
+        if self.profiler is None:
+            raise ValueError('the hashing was not profiled: set profile=True.')
+        return pstats.Stats(self.profiler).sort_stats(sort)
+
+    def __repr__(self):
+        return 'HashingStats({})'.format(', '.join(
+                        '{}={!r}'.format(name, value)
+                        for name, value in self.as_dict().items()))
+
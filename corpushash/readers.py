@@ -0,0 +1,199 @@
+u"""
+read-only access to the hashed documents of a corpus hashed earlier, without
+CorpusHash and without rehashing anything.
+
+HashedCorpus opens a folder in /public, in any output format, and behaves as a
+sequence of hashed documents: it has a length, and can be indexed, sliced,
+sharded and iterated over. documents are only read and parsed when asked for,
+and the most recently used may be kept in an LRU cache, so that e.g. training
+jobs can sample documents without reading the whole corpus.
+"""
+
+import os
+from collections import OrderedDict
+
+from corpushash.formats import open_reader
+
+
+class HashedCorpus:
+    """
+    lazy, read-only sequence of the hashed documents in a folder in /public.
+    slices and shards are views sharing the reader and the cache of the
+    corpus they are taken from, so they cost nothing until documents are read.
+    a HashedCorpus can be sent to worker processes (it is pickled without its
+    open files and cache), e.g. one shard to each.
+    """
+    def __init__(self, path, folder=None, encoding='utf-8', serializer='auto',
+                 cache_size=0):
+        """
+        :param path: str: corpus_path of a hashed corpus, or one of the
+        folders in its /public.
+        :param folder: str: name of the folder in corpus_path/public to read.
+        if None, the latest one is read. ignored if path is a folder in
+        /public.
+        :param encoding: str: encoding of the hashed documents.
+        :param serializer: str or JSONSerializer: JSON library parsing the
+        documents (see corpushash.serializers.get_serializer).
+        :param cache_size: int: number of parsed documents kept in an LRU
+        cache. 0 disables the cache. cached documents are returned as they
+        are, so they should not be modified.
+        """
+        self.public_path = self._find_public_path(path, folder)
+        self.encoding = encoding
+        self.serializer = serializer
+        self.cache_size = cache_size
+        self._state = {'reader': None, 'cache': OrderedDict(), 'hits': 0,
+                       'misses': 0}
+        self._indices = range(len(self._reader))
+
+    @staticmethod
+    def _find_public_path(path, folder):
+        """
+        :return: str: path of the folder in /public to read
+        """
+        public_dir_path = os.path.join(path, 'public')
+        if not os.path.isdir(public_dir_path):
+            if not os.path.isdir(path):
+                raise FileNotFoundError('no hashed corpus at {}.'.format(path))
+            return path
+        if folder is None:
+            folders = sorted(name for name in os.listdir(public_dir_path)
+                             if os.path.isdir(os.path.join(public_dir_path,
+                                                           name)))
+            if not folders:
+                raise FileNotFoundError('no hashed corpus in {}.'.format(
+                                                            public_dir_path))
+            folder = folders[-1]
+        public_path = os.path.join(public_dir_path, os.path.basename(folder))
+        if not os.path.isdir(public_path):
+            raise FileNotFoundError('no hashed corpus at {}.'.format(
+                                                                public_path))
+        return public_path
+
+    @property
+    def _reader(self):
+        """
+        the reader of the folder's format, opened on first use.
+        """
+        if self._state['reader'] is None:
+            self._state['reader'] = open_reader(self.public_path,
+                                                encoding=self.encoding,
+                                                serializer=self.serializer)
+        return self._state['reader']
+
+    def _view(self, indices):
+        """
+        :param indices: range: indices of the documents in the folder.
+        :return: HashedCorpus: view of these documents
+        """
+        view = object.__new__(HashedCorpus)
+        view.__dict__.update(self.__dict__)
+        view._indices = indices
+        return view
+
+    def _read(self, ix):
+        """
+        :param ix: int: index of the document in the folder.
+        :return: list: the parsed document, from the cache if there
+        """
+        state = self._state
+        if not self.cache_size:
+            return self._reader[ix]
+        cache = state['cache']
+        try:
+            document = cache[ix]
+        except KeyError:
+            state['misses'] += 1
+            document = cache[ix] = self._reader[ix]
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+            return document
+        state['hits'] += 1
+        cache.move_to_end(ix)
+        return document
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, key):
+        """
+        :param key: int or slice: index of a document, negative indices
+        counting from the end, or a slice of documents.
+        :return: list or HashedCorpus: the hashed document as a nested list,
+        or a view of the slice
+        """
+        if isinstance(key, slice):
+            return self._view(self._indices[key])
+        return self._read(self._indices[key])
+
+    def __iter__(self):
+        """
+        iterates over the documents in order. contiguous documents are read
+        sequentially, with large buffered reads in the 'jsonl' format. the
+        cache is neither used nor filled, so that a pass over the corpus does
+        not evict the documents cached by indexing.
+        :yield: list: the next hashed document
+        """
+        indices = self._indices
+        reader = self._reader
+        if indices.step == 1:
+            yield from reader.iter_documents(indices.start, indices.stop)
+        else:
+            for ix in indices:
+                yield reader[ix]
+
+    def shard(self, shard, num_shards, contiguous=False):
+        """
+        splits the documents in num_shards views of (about) the same size, so
+        that each worker can iterate over its own.
+        :param shard: int: the shard, from 0 to num_shards - 1.
+        :param num_shards: int: number of shards.
+        :param contiguous: bool: if False, the shard holds every num_shards-th
+        document, from the shard-th one, as CorpusHash.decode_corpus does. if
+        True, it holds a block of consecutive documents, which are read
+        sequentially.
+        :return: HashedCorpus: view of the shard
+        """
+        if not 0 <= shard < num_shards:
+            raise ValueError('shard must be between 0 and num_shards - 1.')
+        if not contiguous:
+            return self[shard::num_shards]
+        size, remainder = divmod(len(self), num_shards)
+        start = shard * size + min(shard, remainder)
+        return self[start:start + size + (shard < remainder)]
+
+    def cache_info(self):
+        """
+        :return: dict: hits and misses of the cache, number of cached
+        documents and cache_size
+        """
+        return {'hits': self._state['hits'], 'misses': self._state['misses'],
+                'entries': len(self._state['cache']),
+                'cache_size': self.cache_size}
+
+    def close(self):
+        """
+        closes the files of the reader (reopened if documents are read again)
+        and empties the cache. views of the same corpus are closed too.
+        :return: None
+        """
+        if self._state['reader'] is not None:
+            self._state['reader'].close()
+            self._state['reader'] = None
+        self._state['cache'].clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_state'] = {'reader': None, 'cache': OrderedDict(), 'hits': 0,
+                           'misses': 0}
+        return state
+
+    def __repr__(self):
+        return 'HashedCorpus({!r}, {} documents)'.format(self.public_path,
+                                                         len(self))
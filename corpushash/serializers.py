@@ -0,0 +1,132 @@
+u"""
+JSON libraries used to write and read the hashed documents and the
+dictionaries.
+
+a serializer turns Python objects into JSON encoded as bytes, ready to be
+written to a binary file, and parses JSON from bytes (or str). JSONSerializer
+uses the json module of the standard library, and writes the same text as
+json.dump(obj, ensure_ascii=False). the others use faster libraries, if they
+are installed: they read and write the same JSON values, but without the
+whitespace json puts after separators, and fall back to the json module for
+the options they don't support. msgpack and similar binary formats are not
+offered, as their output is not JSON.
+"""
+
+import json
+import codecs
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class JSONSerializer:
+    """
+    serializes with the json module of the standard library.
+    """
+    name = 'json'
+    # raised by dumps when a document is nested too deep for the library
+    nesting_errors = (RecursionError,)
+
+    def __init__(self, encoding='utf-8'):
+        """
+        :param encoding: str: encoding of the JSON text.
+        """
+        self.encoding = encoding
+        self.is_utf8 = codecs.lookup(encoding).name == 'utf-8'
+
+    def dumps(self, obj, indent=None):
+        """
+        :param obj: object to be serialized: nested lists and dicts of str.
+        :param indent: int or str or None: indentation, as in json.dump.
+        :return: bytes: obj as encoded JSON text
+        """
+        return json.dumps(obj, indent=indent,
+                          ensure_ascii=False).encode(self.encoding)
+
+    def loads(self, data):
+        """
+        :param data: bytes or str: JSON text, encoded if bytes.
+        :return: the parsed object
+        """
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode(self.encoding)
+        return json.loads(data)
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    serializes with orjson, which only writes UTF-8 and only indents by two
+    spaces.
+    """
+    name = 'orjson'
+    nesting_errors = (RecursionError, TypeError)
+
+    def dumps(self, obj, indent=None):
+        if not self.is_utf8 or indent not in (None, 2):
+            return super().dumps(obj, indent)
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    def loads(self, data):
+        if not self.is_utf8:
+            return super().loads(data)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # e.g. nested too deep for orjson, or invalid (to get the errors
+            # of the json module)
+            return super().loads(data)
+
+
+class UjsonSerializer(JSONSerializer):
+    """
+    serializes with ujson.
+    """
+    name = 'ujson'
+    nesting_errors = (RecursionError, OverflowError)
+
+    def dumps(self, obj, indent=None):
+        if indent is not None and not (isinstance(indent, int) and indent > 0):
+            # ujson can't put newlines without indenting
+            return super().dumps(obj, indent)
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                           indent=indent or 0).encode(self.encoding)
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode(self.encoding)
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            return super().loads(data)
+
+
+SERIALIZERS = {'json': JSONSerializer}
+if orjson is not None:
+    SERIALIZERS['orjson'] = OrjsonSerializer
+if ujson is not None:
+    SERIALIZERS['ujson'] = UjsonSerializer
+
+
+def get_serializer(serializer='auto', encoding='utf-8'):
+    """
+    :param serializer: str or JSONSerializer: name of the JSON library:
+    'orjson', 'ujson' or 'json'. 'auto' picks the first of them that is
+    installed. a serializer is returned as is.
+    :param encoding: str: encoding of the JSON text.
+    :return: JSONSerializer: the serializer
+    """
+    if isinstance(serializer, JSONSerializer):
+        return serializer
+    if serializer == 'auto':
+        serializer = next(name for name in ('orjson', 'ujson', 'json')
+                          if name in SERIALIZERS)
+    if serializer not in SERIALIZERS:
+        raise ValueError('serializer {} not available. choose one of {}.'
+                         .format(serializer, sorted(SERIALIZERS)))
+    return SERIALIZERS[serializer](encoding)
@@ -0,0 +1,196 @@
+u"""
+streaming tokenization of text files into documents that CorpusHash accepts.
+
+iter_text_documents reads text files in chunks and tokenizes their lines in
+batches, optionally in a pool of worker processes, yielding each document as
+soon as it is complete: a list of lines, each a list of sentences, each a list
+of words, as text_split does. the documents can be given to CorpusHash as they
+are, so that a corpus of text files is hashed without ever holding it all in
+memory.
+"""
+
+import re
+import collections
+import multiprocessing
+
+STRIPCHARS = ' .()[]{:},"\';'
+
+
+def tokenize_lines(lines, stripchars=STRIPCHARS, pattern=None):
+    """
+    tokenizes lines of text into sentences of words. sentences end at full
+    stops, and words are separated by whitespace and stripped of stripchars,
+    unless pattern is given.
+    :param lines: iterable of str: lines of text, without line breaks.
+    :param stripchars: str: characters stripped from both ends of each word.
+    :param pattern: str or re.Pattern: if given, the words of a sentence are
+    instead the matches of this regular expression in it (or of its group, as
+    in re.findall).
+    :return: list: the sentences of each line, as lists of words. a line
+    without words has no sentences.
+    """
+    tokenized_lines = []
+    if pattern is not None:
+        findall = re.compile(pattern).findall
+        for line in lines:
+            tokenized_lines.append([words for words in
+                                    map(findall, line.split('.')) if words])
+        return tokenized_lines
+    # str.split and str.strip are faster than any regular expression
+    # equivalent to them
+    for line in lines:
+        sentences = []
+        for sentence in line.split('.'):
+            words = []
+            for word in sentence.split():
+                stripped_word = word.strip(stripchars)
+                if stripped_word:
+                    words.append(stripped_word)
+            if words:
+                sentences.append(words)
+        tokenized_lines.append(sentences)
+    return tokenized_lines
+
+
+def _tokenize_batch(task):
+    """
+    worker function of iter_text_documents.
+    :param task: tuple: file index, lines, stripchars and pattern.
+    :return: tuple: file index and tokenized lines
+    """
+    file_ix, lines, stripchars, pattern = task
+    return file_ix, tokenize_lines(lines, stripchars, pattern)
+
+
+def _imap_bounded(pool, function, iterable, max_pending):
+    """
+    ordered pool.imap, but taking a task from iterable only when fewer than
+    max_pending tasks are in flight, so that iterable is consumed (and the
+    results are kept) at the pace of the consumer of the results, instead of
+    being read ahead whole by the pool.
+    :param pool: multiprocessing.Pool: pool of worker processes.
+    :param function: function: applied to each task.
+    :param iterable: iterable: tasks.
+    :param max_pending: int: maximum number of tasks in flight.
+    :yield: the result of the next task, in order
+    """
+    pending = collections.deque()
+    for task in iterable:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def iter_lines(file_path, encoding='utf-8', read_size=1 << 20):
+    """
+    reads a text file in chunks, without loading it whole.
+    :param file_path: str: path to the text file.
+    :param encoding: str: encoding of the file.
+    :param read_size: int: number of characters read at a time.
+    :yield: str: the next line of the file, without its line break. lines are
+    broken as by str.splitlines.
+    """
+    pending = ''
+    with open(file_path, encoding=encoding) as text_file:
+        while True:
+            chunk = text_file.read(read_size)
+            if not chunk:
+                break
+            lines = (pending + chunk).splitlines(True)
+            last_line = lines[-1]
+            if last_line.splitlines() == [last_line]:
+                # the last line may go on in the next chunk
+                pending = lines.pop()
+            else:
+                pending = ''
+            for line in lines:
+                yield line.splitlines()[0]
+    if pending:
+        yield pending
+
+
+def _iter_batches(file_paths, encoding, batch_lines, read_size, stripchars,
+                  pattern):
+    """
+    :yield: tuple: tasks of _tokenize_batch, of at most batch_lines lines of a
+    single file. each file has at least one task, so that empty files are
+    seen.
+    """
+    for file_ix, file_path in enumerate(file_paths):
+        batch = []
+        for line in iter_lines(file_path, encoding, read_size):
+            batch.append(line)
+            if len(batch) == batch_lines:
+                yield file_ix, batch, stripchars, pattern
+                batch = []
+        yield file_ix, batch, stripchars, pattern
+
+
+def iter_text_documents(file_paths, encoding='utf-8', stripchars=STRIPCHARS,
+                        pattern=None, lines_per_document=None, workers=None,
+                        batch_lines=10000, read_size=1 << 20):
+    """
+    tokenizes text files into documents, streaming them: files are read in
+    chunks, their lines are tokenized batch_lines at a time and each document
+    is yielded when complete.
+    :param file_paths: iterable of str: paths to the text files.
+    :param encoding: str: encoding of the files.
+    :param stripchars: str: characters stripped from both ends of each word
+    (see tokenize_lines).
+    :param pattern: str or re.Pattern: regular expression matching the words
+    of a sentence, instead of splitting it and stripping its words.
+    :param lines_per_document: int: if given, each file is split into
+    documents of this many (non-empty) lines, the last one possibly shorter.
+    otherwise each file is a document, which must then fit in memory.
+    :param workers: int: number of processes tokenizing batches of lines. if
+    None or 1, lines are tokenized in the current process. at most 2 *
+    workers batches are read ahead of the documents yielded.
+    :param batch_lines: int: number of lines tokenized at a time.
+    :param read_size: int: number of characters read from a file at a time.
+    :yield: list: the next document, as a list of lines, each a list of
+    sentences, each a list of words. a document of a whole file is the same
+    as text_split of its text.
+    """
+    if lines_per_document is not None and lines_per_document < 1:
+        raise ValueError('lines_per_document must be a positive integer.')
+    if pattern is not None:
+        pattern = re.compile(pattern)
+    batches = _iter_batches(file_paths, encoding, batch_lines, read_size,
+                            stripchars, pattern)
+    if workers is not None and workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            yield from _assemble_documents(
+                _imap_bounded(pool, _tokenize_batch, batches, 2 * workers),
+                lines_per_document)
+    else:
+        yield from _assemble_documents(map(_tokenize_batch, batches),
+                                       lines_per_document)
+
+
+def _assemble_documents(tokenized_batches, lines_per_document):
+    """
+    :param tokenized_batches: iterable of tuple: file index and tokenized
+    lines, in order.
+    :param lines_per_document: int or None: see iter_text_documents.
+    :yield: list: the next document
+    """
+    document = []
+    current_file_ix = None
+    for file_ix, tokenized_lines in tokenized_batches:
+        if file_ix != current_file_ix:
+            if current_file_ix is not None and (lines_per_document is None or
+                                                document):
+                yield document
+            document = []
+            current_file_ix = file_ix
+        for sentences in tokenized_lines:
+            if not sentences:
+                continue
+            document.append(sentences)
+            if len(document) == lines_per_document:
+                yield document
+                document = []
+    if current_file_ix is not None and (lines_per_document is None or document):
+        yield document
@@ -0,0 +1,141 @@
+import os
+import base64
+import shutil
+from corpushash.hashers import CorpusHash, hash_token
+from corpushash.dictionaries import (JSONDictionaryStore, SQLiteDictionary, 
+                                     SQLiteDictionaryStore, CachedDictionary)
+from corpushash.instrumentation import HashingStats
+import sqlite3
+
+pwd = os.getcwd()
+base_path = os.path.dirname(pwd)
+test_path = os.path.join(base_path, 'corpus_test_dictionaries')
+shutil.rmtree(test_path, ignore_errors=True)
+
+test_corpus = [[['the', 'quick', 'brown', 'fox'], ['jumps', 'over']], 
+               [['the', 'lazy', 'dog'], ['ã', 'ç', '日本']]]
+
+
+def test_sqlite_dictionary_mapping():
+    dictionary = SQLiteDictionary(sqlite3.connect(':memory:'), 'decode', 
+                                  'hashed_token', ['token', 'salt'])
+    dictionary['h1'] = ('a', 's1')
+    dictionary.update_many([('h2', ('b', 's2'))])
+    assert len(dictionary) == 2
+    assert 'h1' in dictionary and 'h3' not in dictionary
+    assert dictionary['h2'] == ('b', 's2')
+    assert dict(dictionary.iter_items()) == {'h1': ('a', 's1'), 'h2': ('b', 's2')}
+    del dictionary['h1']
+    assert list(dictionary) == ['h2']
+
+
+def test_sqlite_backend():
+    sqlite_path = os.path.join(test_path, 'sqlite')
+    os.makedirs(sqlite_path)
+    first_corp = CorpusHash(test_corpus, sqlite_path, dictionary_backend='sqlite')
+    private_files = os.listdir(os.path.join(sqlite_path, 'private'))
+    assert 'dictionaries.sqlite' in private_files
+    assert 'encode_dictionary.json' not in private_files
+    assert len(first_corp.encode_dictionary) == len(first_corp.decode_dictionary) == 11
+    for token in ('the', '日本'):
+        hashed_token = first_corp.encode_dictionary[token]
+        decoded_token, salt = first_corp.decode_dictionary[hashed_token]
+        assert decoded_token == token
+        assert hash_token(token, salt=base64.b85decode(salt))[0] == hashed_token
+    first_corp.dictionary_store.close()
+    second_corp = CorpusHash([['the', 'cat']], sqlite_path, 
+                             dictionary_backend='sqlite')
+    assert len(second_corp.encode_dictionary) == 12
+    assert second_corp.encode_dictionary['the'] == hashed_token_of(sqlite_path, 'the')
+
+
+def hashed_token_of(corpus_path, token):
+    store = SQLiteDictionaryStore(os.path.join(corpus_path, 'private'))
+    encode_dictionary, _ = store.load()
+    hashed_token = encode_dictionary[token]
+    store.close()
+    return hashed_token
+
+
+def test_json_dictionaries_imported_into_sqlite():
+    import_path = os.path.join(test_path, 'import')
+    os.makedirs(import_path)
+    json_corp = CorpusHash(test_corpus, import_path, one_salt=True)
+    sqlite_corp = CorpusHash([['fox', 'cat']], import_path, one_salt=True, 
+                             dictionary_backend='sqlite')
+    assert sqlite_corp.encode_dictionary['fox'] == json_corp.encode_dictionary['fox']
+    assert sqlite_corp.one_salt == json_corp.one_salt
+    assert len(sqlite_corp.decode_dictionary) == len(json_corp.decode_dictionary) + 1
+    json_store = JSONDictionaryStore(os.path.join(import_path, 'private'))
+    assert json_store.load()[0] == json_corp.encode_dictionary
+
+
+def test_sqlite_backend_decoding():
+    decode_path = os.path.join(test_path, 'decode')
+    os.makedirs(decode_path)
+    sqlite_corp = CorpusHash(test_corpus, decode_path, dictionary_backend='sqlite')
+    assert list(sqlite_corp.decode_corpus()) == test_corpus
+
+
+def test_json_checkpoints():
+    private_path = os.path.join(test_path, 'checkpoints')
+    os.makedirs(private_path)
+    store = JSONDictionaryStore(private_path)
+    encode_dictionary, decode_dictionary = store.load()
+    encode_dictionary['a'] = 'h1'
+    decode_dictionary['h1'] = ('a', 's1')
+    store.checkpoint()
+    store.checkpoint()  # nothing new
+    encode_dictionary['b'] = 'h2'
+    decode_dictionary['h2'] = ('b', 's2')
+    store.checkpoint()
+    assert sorted(os.listdir(store.deltas_path)) == ['0.json', '1.json']
+    assert JSONDictionaryStore(private_path).load() == (
+                    {'a': 'h1', 'b': 'h2'}, {'h1': ['a', 's1'], 'h2': ['b', 's2']})
+    store.flush()
+    assert not os.path.exists(store.deltas_path)
+    assert JSONDictionaryStore(private_path).load()[0] == {'a': 'h1', 'b': 'h2'}
+
+
+def test_cached_dictionary():
+    mapping = {'a': 'h1', 'b': 'h2', 'c': 'h3'}
+    entry_memory = CachedDictionary({})._entry_memory('a', 'h1')
+    dictionary = CachedDictionary(mapping, memory_budget=2 * entry_memory)
+    assert dictionary['a'] == 'h1' and dictionary['b'] == 'h2'
+    assert dictionary['a'] == 'h1'  # hit, 'b' is now the least recently used
+    dictionary['d'] = 'h4'  # written through, evicting 'b'
+    assert mapping['d'] == 'h4'
+    assert 'e' not in dictionary
+    info = dictionary.cache_info()
+    assert (info['hits'], info['misses'], info['evictions']) == (1, 3, 1)
+    assert info['entries'] == 2 and info['memory'] <= info['memory_budget']
+    assert dictionary['b'] == 'h2'  # missed, read from the mapping again
+    assert dictionary.misses == 4
+    del dictionary['a']
+    assert 'a' not in mapping and len(dictionary) == 3
+    assert sorted(dictionary) == ['b', 'c', 'd']
+
+
+def test_sqlite_backend_cache():
+    cache_path = os.path.join(test_path, 'cache')
+    os.makedirs(cache_path)
+    stats = HashingStats()
+    cached_corp = CorpusHash(test_corpus, cache_path, dictionary_backend='sqlite', 
+                             dictionary_cache_memory=2000, stats=stats)
+    assert isinstance(cached_corp.encode_dictionary, CachedDictionary)
+    assert cached_corp.encode_dictionary.memory <= 2000
+    # each distinct token of a document is looked up once
+    assert stats.cache_hits + stats.cache_misses == 12
+    assert list(cached_corp.decode_corpus()) == test_corpus
+    cached_corp.dictionary_store.close()
+    uncached_corp = CorpusHash(test_corpus, cache_path, dictionary_backend='sqlite', 
+                               dictionary_cache_memory=0)
+    assert isinstance(uncached_corp.encode_dictionary, SQLiteDictionary)
+    assert len(uncached_corp.encode_dictionary) == 11
+    uncached_corp.dictionary_store.close()
+    # in parallel, each distinct token of a batch is looked up once
+    parallel_stats = HashingStats()
+    CorpusHash(test_corpus, cache_path, dictionary_backend='sqlite', 
+               dictionary_cache_memory=2000, workers=2, stats=parallel_stats)
+    assert parallel_stats.cache_hits + parallel_stats.cache_misses == 11
+    assert parallel_stats.cached_tokens == 11
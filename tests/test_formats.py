@@ -0,0 +1,247 @@
+import os
+import sys
+import json
+import array
+import shutil
+import subprocess
+import corpushash
+from corpushash.formats import (JSONFilesReader, JSONFilesWriter, PackedReader, 
+                                PackedWriter, IdsReader, IdsWriter, BackgroundWriter, 
+                                count_documents, detect_format, iter_hashed_json, 
+                                open_reader, flatten_nested_list, 
+                                unflatten_nested_list)
+
+pwd = os.getcwd()
+base_path = os.path.dirname(pwd)
+test_path = os.path.join(base_path, 'corpus_test_formats')
+shutil.rmtree(test_path, ignore_errors=True)
+os.mkdir(test_path)
+
+documents = [[['a', 'b'], ['c']], [], ['d', ['e', ['f']]], [['ã', '日本']]]
+
+
+def upper(token):
+    return token.upper()
+
+
+def hashed(document):
+    return json.loads(''.join(iter_hashed_json(document, upper)))
+
+
+def test_iter_hashed_json_matches_json_dump():
+    for document in documents:
+        for indent_json in (None, 0, 2, '\t'):
+            hashed_document = hashed(document)
+            assert (''.join(iter_hashed_json(document, upper, indent_json)) == 
+                    json.dumps(hashed_document, indent=indent_json, 
+                               ensure_ascii=False))
+
+
+def test_packed_format():
+    packed_path = os.path.join(test_path, 'packed')
+    os.mkdir(packed_path)
+    writer = PackedWriter(packed_path)
+    for ix, document in enumerate(documents[:2]):
+        writer.write(ix, iter_hashed_json(document, upper))
+    writer.close()
+    # appending, after an interrupted write left a line without its offset
+    with open(os.path.join(packed_path, 'corpus.jsonl'), 'ab') as f:
+        f.write(b'["partial')
+    writer = PackedWriter(packed_path)
+    for ix, document in enumerate(documents[2:], 2):
+        writer.write(ix, iter_hashed_json(document, upper))
+    writer.close()
+    assert detect_format(packed_path) == 'jsonl'
+    assert count_documents(packed_path) == len(documents)
+    reader = open_reader(packed_path)
+    assert isinstance(reader, PackedReader)
+    assert list(reader) == [hashed(document) for document in documents]
+    assert reader[3] == hashed(documents[3])
+    assert reader[1] == []
+    reader.close()
+
+
+def test_packed_writer_order():
+    order_path = os.path.join(test_path, 'order')
+    os.mkdir(order_path)
+    writer = PackedWriter(order_path)
+    try:
+        writer.write(1, '[]')
+    except ValueError:
+        pass
+    else:
+        assert False, 'documents written out of order'
+    writer.close()
+
+
+def test_json_files_format():
+    files_path = os.path.join(test_path, 'files')
+    os.mkdir(files_path)
+    writer = JSONFilesWriter(files_path)
+    for ix, document in enumerate(documents):
+        writer.write(ix, iter_hashed_json(document, upper))
+    reader = open_reader(files_path)
+    assert isinstance(reader, JSONFilesReader)
+    assert detect_format(files_path) == 'json'
+    assert len(reader) == count_documents(files_path) == len(documents)
+    assert reader[2] == hashed(documents[2])
+    assert list(reader) == [hashed(document) for document in documents]
+    # flush syncs the documents written since the size given, by this writer 
+    # or by others (e.g. in worker processes)
+    writer = JSONFilesWriter(files_path, size=len(documents))
+    assert writer._synced_size == len(documents)
+    JSONFilesWriter(files_path).write(len(documents), b'[]')
+    writer.write(len(documents) + 1, b'[]')
+    writer.flush()
+    assert writer._synced_size == len(documents) + 2
+
+
+def test_flatten_nested_list():
+    assert flatten_nested_list([['a', 'b'], 'c', []]) == (
+                        ['a', 'b', 'c'], array.array('i', [3, 1, -2, -1, 0]))
+    for document in documents:
+        assert unflatten_nested_list(*flatten_nested_list(document)) == document
+    mixed_document = ['a', ['b', 'c'], 'd', 'e', [[], ['f']], ('g', ['h'])]
+    tokens, shape = flatten_nested_list(mixed_document)
+    assert tokens == list('abcdefgh')
+    assert shape.tolist() == [5, -1, 1, -2, -2, 2, 0, 1, -1, 2, -1, 1, -1]
+    assert unflatten_nested_list(tokens, shape) == [
+                    'a', ['b', 'c'], 'd', 'e', [[], ['f']], ['g', ['h']]]
+    deep_document = ['a']
+    for _ in range(10000):
+        deep_document = [deep_document, 'b']
+    tokens, shape = flatten_nested_list(deep_document)
+    assert len(tokens) == 10001
+    # (lists this deep can't be compared with ==)
+    assert flatten_nested_list(unflatten_nested_list(tokens, shape)) == (
+                                                                tokens, shape)
+    # sublists are lists even if the tokens are in an array
+    assert unflatten_nested_list(array.array('I', [1, 2, 3]), 
+                                 array.array('i', [2, 1, -2, -1])) == [[1, 2], 3]
+
+
+def test_ids_format():
+    ids_path = os.path.join(test_path, 'ids')
+    os.mkdir(ids_path)
+    for start, stop in ((0, 2), (2, 4)):
+        writer = IdsWriter(ids_path)
+        for ix, document in enumerate(documents[start:stop], start):
+            tokens, shape = flatten_nested_list(document)
+            writer.write(ix, array.array('I', map(writer.token_id, tokens)), 
+                         shape)
+        writer.close()
+    reader = IdsReader(ids_path)
+    vocabulary = reader.vocabulary()
+    assert vocabulary == ['a', 'b', 'c', 'd', 'e', 'f', 'ã', '日本']
+    assert len(reader) == len(documents)
+    for ix, (token_ids, shape) in enumerate(reader):
+        assert (token_ids, shape) == reader[ix]
+        document = unflatten_nested_list([vocabulary[token_id] 
+                                          for token_id in token_ids], shape)
+        assert document == documents[ix]
+
+
+def test_background_writer():
+    background_path = os.path.join(test_path, 'background')
+    os.mkdir(background_path)
+    writer = BackgroundWriter(PackedWriter(background_path), threads=4, 
+                              max_pending=2)
+    assert len(writer._threads) == 1  # packed documents are written in order
+    for ix, document in enumerate(documents):
+        assert writer.write(ix, iter_hashed_json(document, upper)) == 0
+    writer.close()
+    assert writer.bytes_written == (os.path.getsize(os.path.join(
+                                        background_path, 'corpus.jsonl')) + 
+                                    8 * len(documents))
+    assert list(PackedReader(background_path)) == [hashed(document) 
+                                                   for document in documents]
+    writer = BackgroundWriter(JSONFilesWriter(background_path), threads=4)
+    for ix, document in enumerate(documents):
+        writer.write(ix, iter_hashed_json(document, upper))
+    writer.close()
+    assert list(JSONFilesReader(background_path)) == [hashed(document) 
+                                                      for document in documents]
+    # errors are raised in the writing thread
+    writer = BackgroundWriter(PackedWriter(background_path))
+    try:
+        for ix in range(100):
+            writer.write(0, '[]')  # out of order
+        writer.close()
+    except ValueError:
+        pass
+    else:
+        assert False, 'writing error not raised'
+
+
+def write_and_die(folder, script):
+    """
+    runs script in a new process, which then dies without flushing its files.
+    """
+    package_path = os.path.dirname(os.path.dirname(corpushash.__file__))
+    subprocess.run([sys.executable, '-c', 
+                    'import os, array\n'
+                    'from corpushash.formats import PackedWriter, IdsWriter\n'
+                    'folder = {!r}\n{}\nos._exit(0)'.format(folder, script)], 
+                   check=True, env=dict(os.environ, PYTHONPATH=package_path))
+
+
+def test_packed_append_after_crash():
+    crash_path = os.path.join(test_path, 'packed_crash')
+    os.mkdir(crash_path)
+    write_and_die(crash_path, 
+                  'writer = PackedWriter(folder)\n'
+                  'for ix in range(1025):\n'
+                  '    writer.write(ix, b\'["' + 'x' * 40 + '"]\')')
+    size = PackedReader.count(crash_path)
+    assert size == len(PackedReader(crash_path)) < 1025
+    writer = PackedWriter(crash_path)
+    writer.write(size, b'["last"]')
+    writer.close()
+    documents = list(PackedReader(crash_path))
+    assert documents == [['x' * 40]] * size + [['last']]
+    assert PackedReader(crash_path)[size] == ['last']
+
+
+def test_ids_append_after_crash():
+    crash_path = os.path.join(test_path, 'ids_crash')
+    os.mkdir(crash_path)
+    write_and_die(crash_path, 
+                  'writer = IdsWriter(folder)\n'
+                  'for ix in range(3000):\n'
+                  '    token_ids = array.array("I", [writer.token_id(str(ix)), \n'
+                  '                                  writer.token_id("a")])\n'
+                  '    writer.write(ix, token_ids, array.array("i", [1, -2]))')
+    reader = IdsReader(crash_path)
+    size = len(reader)
+    vocabulary = reader.vocabulary()
+    assert 0 < size < 3000
+    for ix, (token_ids, shape) in enumerate(reader):
+        assert [vocabulary[token_id] for token_id in token_ids] == [str(ix), 'a']
+    writer = IdsWriter(crash_path)
+    assert writer.size == size
+    writer.write(size, array.array('I', [writer.token_id('last')]), 
+                 array.array('i', [1, -1]))
+    writer.close()
+    reader = IdsReader(crash_path)
+    vocabulary = reader.vocabulary()
+    assert len(reader) == size + 1
+    token_ids, _ = reader[size]
+    assert [vocabulary[token_id] for token_id in token_ids] == ['last']
+
+
+def test_ids_beyond_vocabulary():
+    ids_path = os.path.join(test_path, 'ids_vocabulary')
+    os.mkdir(ids_path)
+    writer = IdsWriter(ids_path)
+    for ix, tokens in enumerate((['a', 'b'], ['b'], ['c', 'a'], ['d'])):
+        writer.write(ix, array.array('I', map(writer.token_id, tokens)), 
+                     array.array('i', [1, -len(tokens)]))
+    writer.close()
+    vocabulary_path = os.path.join(ids_path, 'ids', 'vocabulary.txt')
+    with open(vocabulary_path, 'r+b') as vocabulary_file:
+        vocabulary_file.truncate(4)  # only 'a' and 'b' are left
+    # the documents written after 'c' got its id are lost
+    assert len(IdsReader(ids_path)) == 2
+    writer = IdsWriter(ids_path)
+    assert writer.size == 2
+    writer.close()
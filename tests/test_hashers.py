@@ -163,3 +163,352 @@ def test_one_salt():
 
 def test_corpus_size():
     assert encoded_corp.corpus_size == len(os.listdir(encoded_corp.public_path))
+
+
+def test_parallel_hashing():
+    parallel_path = os.path.join(base_path, 'corpus_test_parallel')
+    shutil.rmtree(parallel_path, ignore_errors=True)
+    parallel_corp = CorpusHash(encoded_corp.corpus, parallel_path, workers=2, 
+                               chunk_size=5)
+    assert parallel_corp.corpus_size == len(encoded_corp.corpus)
+    assert len(parallel_corp.encode_dictionary) == len(parallel_corp.decode_dictionary)
+    for ix, document in enumerate(encoded_corp.corpus):
+        with open(os.path.join(parallel_corp.public_path, '{}.json'.format(ix)), 
+                  encoding='utf-8') as f:
+            hashed_document = json.load(f)
+        assert len(hashed_document) == len(document)
+        for hashed_token, token in zip(walk_nested_list(hashed_document), 
+                                       walk_nested_list(document)):
+            assert parallel_corp.decode_dictionary[hashed_token][0] == token
+
+
+def test_empty_corpus():
+    empty_path = os.path.join(base_path, 'corpus_test_empty')
+    shutil.rmtree(empty_path, ignore_errors=True)
+    empty_corp = CorpusHash([], empty_path)
+    assert empty_corp.corpus_size == 0
+    assert os.listdir(empty_corp.public_path) == []
+
+
+def test_streaming_corpus():
+    stream_path = os.path.join(base_path, 'corpus_test_stream')
+    shutil.rmtree(stream_path, ignore_errors=True)
+    os.mkdir(stream_path)
+    jsonl_path = os.path.join(stream_path, 'corpus.jsonl')
+    with open(jsonl_path, 'wt', encoding='utf-8') as f:
+        for document in encoded_corp.corpus:
+            f.write(json.dumps(document, ensure_ascii=False) + '\n')
+    for workers in (None, 2):
+        stream_corp = CorpusHash(read_jsonl_corpus(jsonl_path), stream_path, 
+                                 workers=workers, chunk_size=4)
+        assert stream_corp.corpus_size == len(encoded_corp.corpus)
+        document_paths = (os.path.join(stream_corp.public_path, '{}.json'.format(ix)) 
+                          for ix in range(stream_corp.corpus_size))
+        for hashed_document, document in zip(read_json_documents(document_paths), 
+                                             encoded_corp.corpus):
+            tokens = [stream_corp.decode_dictionary[hashed_token][0] 
+                      for hashed_token in walk_nested_list(hashed_document)]
+            assert tokens == list(walk_nested_list(document))
+
+
+def test_deeply_nested_document():
+    deep_path = os.path.join(base_path, 'corpus_test_deep')
+    shutil.rmtree(deep_path, ignore_errors=True)
+    deep_document = ['leaf']
+    for _ in range(5000):  # deeper than the recursion limit
+        deep_document = [deep_document, 'node']
+    deep_corp = CorpusHash([deep_document, encoded_corp.corpus[0]], deep_path, 
+                           indent_json=1)
+    with open(os.path.join(deep_corp.public_path, '0.json'), encoding='utf-8') as f:
+        hashed_text = f.read()
+    assert hashed_text.count('[') == hashed_text.count(']') == 5001
+    assert hashed_text.count(deep_corp.encode_dictionary['node']) == 5000
+    with open(os.path.join(deep_corp.public_path, '1.json'), encoding='utf-8') as f:
+        hashed_text = f.read()
+    hashed_document = deep_corp._hash_document(encoded_corp.corpus[0])
+    assert hashed_text == json.dumps(hashed_document, indent=1)
+
+
+@given(hypothesis.strategies.lists(hypothesis.strategies.text()))
+def test_hash_tokens_matches_hash_token(tokens):
+    hashed_tokens = hash_tokens(tokens, salt_length=5)
+    assert len(hashed_tokens) == len(tokens)
+    for token, (hashed_token, salt) in zip(tokens, hashed_tokens):
+        assert len(salt) == 5
+        assert hash_token(token, salt=salt)[0] == hashed_token
+
+
+def test_hash_tokens_one_salt():
+    salt = os.urandom(8)
+    hashed_tokens = hash_tokens(['a', 'b', 'a'], hash_function='md5', salt=salt)
+    assert [token_salt for _, token_salt in hashed_tokens] == [salt] * 3
+    assert hashed_tokens[0][0] == hashed_tokens[2][0] == hash_token('a', 
+                                        hash_function='md5', salt=salt)[0]
+
+
+def test_append_mode():
+    append_path = os.path.join(base_path, 'corpus_test_append')
+    shutil.rmtree(append_path, ignore_errors=True)
+    # fingerprints are only taken when appending
+    first_corp = CorpusHash(encoded_corp.corpus[:10], append_path, append=True)
+    assert os.path.isfile(first_corp.fingerprints_path)
+    for workers, stop in ((None, 15), (2, 18)):
+        appended_corp = CorpusHash(encoded_corp.corpus[5:stop], append_path, 
+                                   append=True, workers=workers)
+        assert appended_corp.public_path == first_corp.public_path
+        assert appended_corp.start_index in (10, 15)
+        assert appended_corp.corpus_size == stop
+        assert len(os.listdir(appended_corp.public_path)) == stop
+    for ix, document in enumerate(encoded_corp.corpus[:18]):
+        with open(os.path.join(first_corp.public_path, '{}.json'.format(ix)), 
+                  encoding='utf-8') as f:
+            hashed_document = json.load(f)
+        tokens = [appended_corp.decode_dictionary[hashed_token][0] 
+                  for hashed_token in walk_nested_list(hashed_document)]
+        assert tokens == list(walk_nested_list(document))
+    os.mkdir(os.path.join(append_path, 'public', 'empty'))
+    named_corp = CorpusHash(encoded_corp.corpus[:2], append_path, append='empty')
+    assert named_corp.corpus_size == 2
+    unfingerprinted_corp = CorpusHash(encoded_corp.corpus[:1], append_path)
+    assert not os.path.exists(unfingerprinted_corp.fingerprints_path)
+
+
+def test_append_after_interruption():
+    append_path = os.path.join(base_path, 'corpus_test_append_interrupted')
+    corpus = encoded_corp.corpus[:12]
+
+    def interrupted_corpus():
+        yield from corpus[:10]
+        raise KeyboardInterrupt
+
+    for workers, backend in ((None, 'json'), (2, 'json'), (2, 'sqlite')):
+        shutil.rmtree(append_path, ignore_errors=True)
+        options = dict(append=True, workers=workers, chunk_size=2, 
+                       dictionary_backend=backend)
+        try:
+            CorpusHash(interrupted_corpus(), append_path, **options)
+        except KeyboardInterrupt:
+            pass
+        else:
+            assert False, 'hashing not interrupted'
+        # documents taken from the corpus but not written, or whose tokens 
+        # were not stored, are hashed again
+        appended_corp = CorpusHash(corpus, append_path, **options)
+        appended_documents = [appended_corp.decode_document(
+                                    appended_corp.read_hashed_document(ix)) 
+                              for ix in range(appended_corp.start_index, 
+                                              appended_corp.corpus_size)]
+        assert all(document in appended_documents for document in corpus)
+        assert CorpusHash(corpus, append_path, **options).corpus_size == (
+                                                    appended_corp.corpus_size)
+
+
+def test_packed_output():
+    packed_path = os.path.join(base_path, 'corpus_test_packed')
+    shutil.rmtree(packed_path, ignore_errors=True)
+    packed_corp = CorpusHash(encoded_corp.corpus[:10], packed_path, append=True, 
+                             output_format='jsonl', indent_json=2)
+    assert sorted(os.listdir(packed_corp.public_path)) == ['corpus.index', 
+                                                           'corpus.jsonl']
+    appended_corp = CorpusHash(encoded_corp.corpus, packed_path, append=True, 
+                               output_format='jsonl', workers=2, chunk_size=3)
+    assert appended_corp.corpus_size == len(encoded_corp.corpus)
+    hashed_corpus = list(appended_corp.read_hashed_corpus())
+    assert len(hashed_corpus) == len(encoded_corp.corpus)
+    for ix, (hashed_document, document) in enumerate(zip(hashed_corpus, 
+                                                         encoded_corp.corpus)):
+        assert appended_corp.read_hashed_document(ix) == hashed_document
+        assert hashed_document == appended_corp._hash_document(document)
+    # documents are read through the same reader, reopened after hashing
+    reader = appended_corp._reader
+    assert appended_corp.read_hashed_document(0) == hashed_corpus[0]
+    assert appended_corp._reader is reader
+    appended_corp.hash_corpus()
+    assert appended_corp._reader is None
+    assert appended_corp.read_hashed_document(ix) == hashed_corpus[ix]
+
+
+def test_integer_ids():
+    ids_path = os.path.join(base_path, 'corpus_test_ids')
+    shutil.rmtree(ids_path, ignore_errors=True)
+    ids_corp = CorpusHash(encoded_corp.corpus[:10], ids_path, integer_ids=True, 
+                          append=True)
+    appended_corp = CorpusHash(encoded_corp.corpus, ids_path, append=True, 
+                               integer_ids=True, output_format='json', 
+                               workers=2, chunk_size=3)
+    vocabulary = appended_corp.read_id_vocabulary()
+    assert len(vocabulary) == len(set(vocabulary))
+    id_corpus = list(appended_corp.read_id_corpus(nested=True))
+    assert len(id_corpus) == len(encoded_corp.corpus)
+    for id_document, hashed_document in zip(id_corpus, 
+                                            appended_corp.read_hashed_corpus()):
+        assert id_document == unflatten_nested_list(
+                    [vocabulary.index(hashed_token) for hashed_token 
+                     in walk_nested_list(hashed_document)], 
+                    flatten_nested_list(hashed_document)[1])
+    try:
+        CorpusHash(encoded_corp.corpus[:1], ids_path, append=True)
+    except ValueError:
+        pass
+    else:
+        assert False, 'appended without integer ids'
+
+
+def test_decode_corpus():
+    corpus = encoded_corp.corpus
+    assert list(encoded_corp.decode_corpus()) == corpus
+    assert list(encoded_corp.decode_corpus(shard=1, num_shards=3)) == corpus[1::3]
+    assert list(encoded_corp.decode_corpus(workers=2)) == corpus
+    hashed_document = encoded_corp.read_hashed_document(0)
+    assert encoded_corp.decode_document(hashed_document) == corpus[0]
+    token = corpus[0][0][0][0]
+    assert encoded_corp.decode_document(encoded_corp.encode_dictionary[token]) == token
+
+
+@given(hypothesis.strategies.text())
+def test_keyed_hash_token(s):
+    key = b'secret key'
+    for hash_function in ('sha256', 'blake2b'):
+        hashed_token = keyed_hash_token(s, key, hash_function)
+        assert hashed_token == keyed_hash_token(s, key, hash_function)
+        assert hashed_token != keyed_hash_token(s, b'other key', hash_function)
+        assert keyed_hash_tokens([s, s], key, hash_function) == [hashed_token] * 2
+
+
+def test_keyed_hashing():
+    keyed_path = os.path.join(base_path, 'corpus_test_keyed')
+    shutil.rmtree(keyed_path, ignore_errors=True)
+    keyed_corp = CorpusHash(encoded_corp.corpus[:5], keyed_path, key=True)
+    key_path = os.path.join(keyed_path, 'private', 'hash.key')
+    with open(key_path, 'rb') as f:
+        key = f.read()
+    assert keyed_corp.key == key
+    for token, hashed_token in keyed_corp.encode_dictionary.items():
+        assert keyed_hash_token(token, key) == hashed_token
+        assert tuple(keyed_corp.decode_dictionary[hashed_token]) == (token, None)
+    assert list(keyed_corp.decode_corpus()) == encoded_corp.corpus[:5]
+    # stateless hashing, e.g. on another machine, gives the same hashes
+    stateless_path = os.path.join(base_path, 'corpus_test_stateless')
+    shutil.rmtree(stateless_path, ignore_errors=True)
+    for workers in (None, 2):
+        stateless_corp = CorpusHash(encoded_corp.corpus[:5], stateless_path, 
+                                    key=key, store_dictionaries=False, 
+                                    workers=workers, chunk_size=2)
+        assert stateless_corp.encode_dictionary == {}
+        assert (list(stateless_corp.read_hashed_corpus()) == 
+                list(keyed_corp.read_hashed_corpus()))
+    assert not os.path.exists(os.path.join(stateless_path, 'private', 
+                                           'encode_dictionary.json'))
+    try:
+        CorpusHash(encoded_corp.corpus[:1], keyed_path, key=b'wrong key')
+    except ValueError:
+        pass
+    else:
+        assert False, 'hashed with a different key'
+
+
+def test_hashing_stats():
+    stats_path = os.path.join(base_path, 'corpus_test_stats')
+    shutil.rmtree(stats_path, ignore_errors=True)
+    corpus = encoded_corp.corpus[:6]
+    tokens = [token for document in corpus for token in walk_nested_list(document)]
+    for workers, output_format in ((None, 'json'), (2, 'jsonl')):
+        reports = []
+        stats = HashingStats(callback=lambda stats: reports.append(stats.documents), 
+                             report_every=4)
+        stats_corp = CorpusHash(corpus, stats_path, workers=workers, 
+                                chunk_size=2, output_format=output_format, 
+                                integer_ids=True, stats=stats)
+        assert stats_corp.stats is stats
+        assert reports[0] >= 4 and reports[-1] == len(corpus)
+        assert stats.documents == len(corpus)
+        assert stats.tokens == len(tokens)
+        # the vocabulary was hashed the first time only
+        assert stats.new_tokens == (len(set(tokens)) if workers is None else 0)
+        assert stats.bytes_written == sum(
+                    os.path.getsize(os.path.join(root, file_name)) 
+                    for root, _, file_names in os.walk(stats_corp.public_path) 
+                    for file_name in file_names)
+        assert stats.elapsed >= (stats.hashing_time + stats.serialization_time + 
+                                 stats.writing_time)
+
+
+def test_serializers():
+    serializer_path = os.path.join(base_path, 'corpus_test_serializers')
+    shutil.rmtree(serializer_path, ignore_errors=True)
+    key = b'serializer key'
+    hashed_corpora = []
+    for serializer in ('json', 'auto'):
+        for output_format in ('json', 'jsonl'):
+            serializer_corp = CorpusHash(encoded_corp.corpus[:4], serializer_path, 
+                                         key=key, serializer=serializer, 
+                                         output_format=output_format)
+            assert list(serializer_corp.decode_corpus()) == encoded_corp.corpus[:4]
+            hashed_corpora.append(serializer_corp)
+    hashed_documents = list(hashed_corpora[0].read_hashed_corpus())
+    for serializer_corp in hashed_corpora:
+        assert list(serializer_corp.read_hashed_corpus()) == hashed_documents
+    # the standard library writes what json.dump does
+    with open(os.path.join(hashed_corpora[1].public_path, 'corpus.jsonl'), 
+              encoding='utf-8') as f:
+        assert f.readline() == json.dumps(hashed_documents[0]) + '\n'
+
+
+def test_background_writing():
+    background_path = os.path.join(base_path, 'corpus_test_background')
+    shutil.rmtree(background_path, ignore_errors=True)
+    key = b'background key'
+    for workers in (None, 2):
+        for output_format in ('json', 'jsonl'):
+            corpora = [CorpusHash(encoded_corp.corpus, background_path, key=key, 
+                                  workers=workers, chunk_size=3, 
+                                  output_format=output_format, integer_ids=True, 
+                                  write_threads=write_threads) 
+                       for write_threads in (None, 3)]
+            assert (list(corpora[0].read_hashed_corpus()) == 
+                    list(corpora[1].read_hashed_corpus()))
+            assert (list(corpora[0].read_id_corpus(nested=True)) == 
+                    list(corpora[1].read_id_corpus(nested=True)))
+            assert corpora[0].stats.bytes_written == corpora[1].stats.bytes_written
+
+
+def test_checkpoint_and_resume():
+    resume_path = os.path.join(base_path, 'corpus_test_resume')
+    corpus = encoded_corp.corpus[:10]
+
+    def interrupted_corpus():
+        for document in corpus[:8]:
+            yield document
+        raise KeyboardInterrupt  # e.g. the node is preempted
+
+    for workers, output_format, backend in ((None, 'json', 'json'), 
+                                            (None, 'jsonl', 'sqlite'), 
+                                            (2, 'jsonl', 'json')):
+        shutil.rmtree(resume_path, ignore_errors=True)
+        options = dict(workers=workers, chunk_size=2, output_format=output_format, 
+                       integer_ids=True, dictionary_backend=backend, 
+                       checkpoint_every=3, append=True)
+        try:
+            CorpusHash(interrupted_corpus(), resume_path, **options)
+        except KeyboardInterrupt:
+            pass
+        else:
+            assert False, 'hashing not interrupted'
+        with open(os.path.join(resume_path, 'private', 'checkpoint.json')) as f:
+            checkpoint = json.load(f)
+        # with workers, checkpoints are made between batches of 2 * 2 chunks
+        assert checkpoint['documents'] == (6 if workers is None else 8)
+        resumed_corp = CorpusHash(corpus, resume_path, resume=True, **options)
+        assert resumed_corp.start_index == checkpoint['documents']
+        assert resumed_corp.corpus_size == len(corpus)
+        assert len(os.listdir(os.path.join(resume_path, 'public'))) == 1
+        assert list(resumed_corp.decode_corpus()) == corpus
+        vocabulary = resumed_corp.read_id_vocabulary()
+        assert [[resumed_corp.decode_document(vocabulary[token_id]) 
+                 for token_id in token_ids] 
+                for token_ids, _ in resumed_corp.read_id_corpus()] == [
+                    list(walk_nested_list(document)) for document in corpus]
+        assert not os.path.exists(os.path.join(resume_path, 'private', 
+                                               'checkpoint.json'))
+        # the fingerprints of the documents are kept once
+        assert CorpusHash(corpus, resume_path, **options).corpus_size == len(corpus)
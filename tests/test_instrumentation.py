@@ -0,0 +1,46 @@
+import time
+import pstats
+import tracemalloc
+from corpushash.instrumentation import HashingStats
+
+
+def test_callback_reports():
+    reports = []
+    stats = HashingStats(callback=lambda stats: reports.append(stats.documents), 
+                         report_every=10)
+    stats.start()
+    for _ in range(25):
+        stats.add_documents()
+    stats.add_documents(20)
+    stats.stop()
+    assert reports == [10, 20, 45, 45]
+
+
+def test_timer():
+    stats = HashingStats()
+    stats.start()
+    with stats.timer('hashing'):
+        time.sleep(0.01)
+    stats.add_time('writing', 1.5)
+    stats.stop()
+    assert stats.hashing_time >= 0.01
+    assert stats.serialization_time == 0
+    assert stats.writing_time == 1.5
+    assert stats.elapsed >= stats.hashing_time
+    assert stats.as_dict()['elapsed'] == stats.elapsed
+
+
+def test_profile_and_trace_memory():
+    stats = HashingStats(profile=True, trace_memory=True)
+    try:
+        stats.profile_stats()
+    except ValueError:
+        pass
+    else:
+        assert False, 'profile statistics before profiling'
+    stats.start()
+    data = [str(i) for i in range(10000)]
+    stats.stop()
+    assert not tracemalloc.is_tracing()
+    assert stats.peak_memory > 0
+    assert isinstance(stats.profile_stats(), pstats.Stats)
@@ -0,0 +1,102 @@
+import os
+import pickle
+import shutil
+import multiprocessing
+from corpushash.hashers import CorpusHash
+from corpushash.readers import HashedCorpus
+
+pwd = os.getcwd()
+base_path = os.path.dirname(pwd)
+test_path = os.path.join(base_path, 'corpus_test_readers')
+shutil.rmtree(test_path, ignore_errors=True)
+os.mkdir(test_path)
+
+test_corpus = [[['document', str(ix)], ['token', 'ç' * (ix % 3)]]
+               for ix in range(11)]
+
+
+def hash_corpus(name, **options):
+    corpus_path = os.path.join(test_path, name)
+    hashed_corpus = CorpusHash(test_corpus, corpus_path, **options)
+    return corpus_path, list(hashed_corpus.read_hashed_corpus())
+
+
+def count_documents(shard):
+    return sum(1 for _ in shard)
+
+
+def test_indexing_and_slicing():
+    for output_format in ('json', 'jsonl'):
+        corpus_path, hashed_documents = hash_corpus(output_format,
+                                                    output_format=output_format)
+        corpus = HashedCorpus(corpus_path)
+        assert len(corpus) == len(test_corpus)
+        assert list(corpus) == hashed_documents
+        assert corpus[3] == hashed_documents[3]
+        assert corpus[-1] == hashed_documents[-1]
+        for key in (slice(2, 7), slice(None, None, -2), slice(1, 100, 3),
+                    slice(5, 2)):
+            view = corpus[key]
+            assert isinstance(view, HashedCorpus)
+            assert list(view) == hashed_documents[key]
+            assert [view[ix] for ix in range(len(view))] == hashed_documents[key]
+        assert list(corpus[2:9][1:-1:2]) == hashed_documents[2:9][1:-1:2]
+        try:
+            corpus[len(test_corpus)]
+        except IndexError:
+            pass
+        else:
+            assert False, 'index out of range'
+        corpus.close()
+
+
+def test_shards():
+    corpus_path, hashed_documents = hash_corpus('shards', output_format='jsonl')
+    corpus = HashedCorpus(corpus_path)
+    for contiguous in (False, True):
+        shards = [corpus.shard(shard, 3, contiguous=contiguous)
+                  for shard in range(3)]
+        assert [len(shard) for shard in shards] == [4, 4, 3]
+        documents = [document for shard in shards for document in shard]
+        assert sorted(documents) == sorted(hashed_documents)
+    assert list(corpus.shard(1, 3, contiguous=True)) == hashed_documents[4:8]
+    assert list(corpus.shard(1, 3)) == hashed_documents[1::3]
+    # shards can be sent to worker processes
+    with multiprocessing.Pool(2) as pool:
+        counts = pool.map(count_documents, [corpus.shard(shard, 2)
+                                            for shard in range(2)])
+    assert counts == [6, 5]
+
+
+def test_cache():
+    corpus_path, hashed_documents = hash_corpus('cache')
+    corpus = HashedCorpus(corpus_path, cache_size=2)
+    for ix in (0, 1, 0, 2, 1, 0):
+        assert corpus[ix] == hashed_documents[ix]
+    assert corpus.cache_info() == {'hits': 1, 'misses': 5, 'entries': 2,
+                                   'cache_size': 2}
+    # views share the cache, and iterating leaves it untouched
+    assert corpus[1:][0] == hashed_documents[1]
+    assert list(corpus) == hashed_documents
+    assert corpus.cache_info()['hits'] == 2
+    unpickled_corpus = pickle.loads(pickle.dumps(corpus[::2]))
+    assert list(unpickled_corpus) == hashed_documents[::2]
+    assert unpickled_corpus.cache_info()['entries'] == 0
+
+
+def test_folders():
+    corpus_path = os.path.join(test_path, 'folders')
+    first_corp = CorpusHash(test_corpus[:3], corpus_path)
+    second_corp = CorpusHash(test_corpus, corpus_path)
+    assert HashedCorpus(corpus_path).public_path == second_corp.public_path
+    first_folder = os.path.basename(first_corp.public_path)
+    assert len(HashedCorpus(corpus_path, folder=first_folder)) == 3
+    assert len(HashedCorpus(first_corp.public_path)) == 3
+    for path, folder in ((os.path.join(test_path, 'nothing'), None),
+                         (corpus_path, 'nothing')):
+        try:
+            HashedCorpus(path, folder=folder)
+        except FileNotFoundError:
+            pass
+        else:
+            assert False, 'no hashed corpus'
@@ -0,0 +1,37 @@
+import json
+from corpushash.serializers import SERIALIZERS, JSONSerializer, get_serializer
+
+values = [[['a', 'b'], ['c']], [], ['d', ['e', ['f']]], [['ã', '日本', '"\\/\n']], 
+          {'token': 'hash', 'ü': ['x', None]}]
+
+
+def test_serializers_round_trip():
+    for name in SERIALIZERS:
+        for encoding in ('utf-8', 'utf-16'):
+            serializer = get_serializer(name, encoding)
+            for value in values:
+                for indent in (None, 0, 2, 4):
+                    data = serializer.dumps(value, indent)
+                    assert json.loads(data.decode(encoding)) == value
+                    assert serializer.loads(data) == value
+                    assert serializer.loads(data.decode(encoding)) == value
+
+
+def test_json_serializer_matches_json_dump():
+    serializer = get_serializer('json')
+    for value in values:
+        assert (serializer.dumps(value, 2) == 
+                json.dumps(value, indent=2, ensure_ascii=False).encode())
+
+
+def test_get_serializer():
+    serializer = get_serializer('auto')
+    assert serializer.name in SERIALIZERS
+    assert get_serializer(serializer) is serializer
+    assert isinstance(get_serializer('json', 'latin-1'), JSONSerializer)
+    try:
+        get_serializer('msgpack')
+    except ValueError:
+        pass
+    else:
+        assert False, 'got an unavailable serializer'
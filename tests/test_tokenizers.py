@@ -0,0 +1,87 @@
+import os
+import re
+import shutil
+from corpushash.hashers import CorpusHash, text_split
+from corpushash.tokenizers import iter_lines, iter_text_documents, tokenize_lines
+
+pwd = os.getcwd()
+base_path = os.path.dirname(pwd)
+test_path = os.path.join(base_path, 'corpus_test_tokenizers')
+shutil.rmtree(test_path, ignore_errors=True)
+os.mkdir(test_path)
+
+texts = ['Beautiful is better than ugly. Explicit is better than implicit.\n'
+         '\n(Simple) is better than "complex"...\r\n'
+         'Complex is better than complicated\rFlat. is. better\n',
+         '',
+         'ã 日本  . . \nlast line without a break']
+
+
+def write_texts():
+    file_paths = []
+    for ix, text in enumerate(texts):
+        file_path = os.path.join(test_path, '{}.txt'.format(ix))
+        with open(file_path, 'w', encoding='utf-8', newline='') as text_file:
+            text_file.write(text)
+        file_paths.append(file_path)
+    return file_paths
+
+
+def test_iter_lines_across_chunks():
+    file_paths = write_texts()
+    for file_path, text in zip(file_paths, texts):
+        expected = open(file_path, encoding='utf-8').read().splitlines()
+        for read_size in (1, 2, 7, 1 << 20):
+            assert list(iter_lines(file_path, read_size=read_size)) == expected
+
+
+def test_documents_match_text_split():
+    file_paths = write_texts()
+    expected = [text_split(open(file_path, encoding='utf-8').read())
+                for file_path in file_paths]
+    assert list(iter_text_documents(file_paths)) == expected
+    assert list(iter_text_documents(file_paths, batch_lines=1, read_size=3,
+                                    workers=2)) == expected
+
+
+def test_lines_per_document():
+    file_paths = write_texts()
+    lines = text_split(open(file_paths[0], encoding='utf-8').read())
+    documents = list(iter_text_documents(file_paths, lines_per_document=2,
+                                         batch_lines=3))
+    assert documents[:2] == [lines[:2], lines[2:]]
+    # the empty file has no document, the last one has two lines
+    assert len(documents) == 3 and len(documents[2]) == 2
+
+
+def test_workers_read_ahead():
+    file_paths = write_texts()
+    taken = []
+
+    def iter_file_paths():
+        for file_path in file_paths * 50:
+            taken.append(file_path)
+            yield file_path
+
+    documents = iter_text_documents(iter_file_paths(), workers=2)
+    assert next(documents) == text_split(open(file_paths[0],
+                                              encoding='utf-8').read())
+    # a few batches (here files) are read ahead, not the whole input
+    assert len(taken) <= 2 * 2 + 1
+    documents.close()
+
+
+def test_pattern():
+    tokenized = tokenize_lines(['Flat is better. than nested!', ''],
+                               pattern=re.compile(r'\w+'))
+    assert tokenized == [[['Flat', 'is', 'better'], ['than', 'nested']], []]
+
+
+def test_hash_text_files():
+    file_paths = write_texts()
+    corpus_path = os.path.join(test_path, 'hashed')
+    hashed_corpus = CorpusHash(iter_text_documents(file_paths, workers=2),
+                               corpus_path)
+    expected = list(iter_text_documents(file_paths))
+    assert hashed_corpus.corpus_size == len(expected)
+    assert list(hashed_corpus.decode_corpus()) == expected